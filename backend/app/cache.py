@@ -0,0 +1,245 @@
+import base64
+import json
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+import orjson
+from urllib.parse import quote
+from . import metrics
+from .catalog import canonical_destination, food_bucket
+
+logger = logging.getLogger(__name__)
+
+# Redis connection shared with fastapi-cache; set from main.startup
+_redis = None
+
+def set_redis(redis):
+    global _redis
+    _redis = redis
+
+def get_redis():
+    return _redis
+
+class LRUCache:
+    """Bounded in-process cache with a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+class TwoTierCache:
+    """In-process LRU in front of Redis, with JSON values and hit/miss counters.
+
+    Redis errors are logged and treated as misses so a cache outage never
+    fails the request.
+    """
+
+    def __init__(self, namespace: str, ttl: int, maxsize: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _redis_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    async def get_many(self, keys):
+        """Return a dict with the cached value for every key that was found."""
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                remote.append(key)
+        local_hits = len(found)
+        self.stats["local_hits"] += local_hits
+
+        redis = get_redis()
+        if remote and redis is not None:
+            try:
+                values = await redis.mget([self._redis_key(key) for key in remote])
+            except Exception as e:
+                logger.warning(f"Redis lookup failed for {self.namespace}: {str(e)}")
+                values = [None] * len(remote)
+            for key, raw in zip(remote, values):
+                if raw is not None:
+                    value = json.loads(raw)
+                    found[key] = value
+                    self.local.set(key, value)
+                    self.stats["redis_hits"] += 1
+
+        self.stats["misses"] += len(keys) - len(found)
+        metrics.record_cache_lookup(self.namespace, "local_hit", local_hits)
+        metrics.record_cache_lookup(self.namespace, "redis_hit", len(found) - local_hits)
+        metrics.record_cache_lookup(self.namespace, "miss", len(keys) - len(found))
+        return found
+
+    async def get(self, key):
+        return (await self.get_many([key])).get(key)
+
+    async def set_many(self, items, ttl: int = None):
+        ttl = ttl or self.ttl
+        for key, value in items.items():
+            self.local.set(key, value, ttl)
+
+        redis = get_redis()
+        if items and redis is not None:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key, value in items.items():
+                        pipe.set(self._redis_key(key), json.dumps(value), ex=ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Redis write failed for {self.namespace}: {str(e)}")
+
+    async def set(self, key, value, ttl: int = None):
+        await self.set_many({key: value}, ttl)
+
+    def hit_ratio(self):
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+class StaleWhileRevalidateCache(TwoTierCache):
+    """TwoTierCache whose entries stay servable for stale_ttl after going stale.
+
+    get_many returns (value, is_stale) pairs; callers serve stale values right
+    away and refresh them in the background. Values may be None, which lets
+    callers cache negative results.
+    """
+
+    def __init__(self, namespace: str, ttl: int, stale_ttl: int, maxsize: int):
+        super().__init__(namespace, ttl + stale_ttl, maxsize)
+        self.fresh_ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats["stale_hits"] = 0
+
+    async def get_many(self, keys):
+        entries = await super().get_many(keys)
+        now = time.time()
+        found = {}
+        for key, entry in entries.items():
+            is_stale = entry["fresh_until"] < now
+            found[key] = (entry["value"], is_stale)
+            if is_stale:
+                self.stats["stale_hits"] += 1
+                metrics.record_cache_lookup(self.namespace, "stale")
+        return found
+
+    async def get(self, key):
+        return (await self.get_many([key])).get(key)
+
+    async def set_many(self, items, ttl: int = None):
+        fresh_until = time.time() + (ttl or self.fresh_ttl)
+        entries = {key: {"value": value, "fresh_until": fresh_until} for key, value in items.items()}
+        await super().set_many(entries, (ttl or self.fresh_ttl) + self.stale_ttl)
+
+# Bump when the cached value format or the key derivation changes
+RESPONSE_CACHE_FORMAT = "3"
+RESPONSE_CACHE_PREFIX = "fastapi-cache"
+RESPONSE_CACHE_NAMESPACE = "itinerary"
+# How long generated itineraries are served from the response cache
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+def itinerary_cache_key(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    """fastapi-cache key builder for /generate_itinerary/.
+
+    Keys are hierarchical (namespace:format:generator version:destination:days:food)
+    so one destination or one generator version can be dropped with a prefix
+    scan, and spelling variants of the same trip share an entry.
+    """
+    # Imported here: itinerary_generator imports this module
+    from .itinerary_generator import GENERATOR_VERSION
+    kwargs = kwargs or {}
+    parts = (
+        RESPONSE_CACHE_FORMAT,
+        GENERATOR_VERSION,
+        canonical_destination(kwargs["destination"]),
+        str(kwargs["no_of_days"]),
+        food_bucket(kwargs["food_preference"]),
+    )
+    return ":".join([namespace.rstrip(":")] + [quote(part, safe="") for part in parts])
+
+def itinerary_response_key(destination, no_of_days, food_preference):
+    """The key /generate_itinerary/ caches this trip under."""
+    return itinerary_cache_key(
+        None, f"{RESPONSE_CACHE_PREFIX}:{RESPONSE_CACHE_NAMESPACE}",
+        kwargs={"destination": destination, "no_of_days": no_of_days, "food_preference": food_preference},
+    )
+
+class CompressedJsonCoder:
+    """fastapi-cache coder storing zlib-compressed JSON as base64 text.
+
+    The Redis client decodes responses to str, so values must be text. A hit
+    is handed back as the JSON bytes themselves, which the route sends without
+    parsing them. encode() only runs on a miss and decode_as_type() only on a
+    hit, which is where the hit/miss counts come from.
+    """
+
+    name = "itinerary_response"
+    stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def encode(cls, value):
+        cls.stats["misses"] += 1
+        metrics.record_cache_lookup(cls.name, "miss")
+        return cls.pack(value)
+
+    @classmethod
+    def pack(cls, value):
+        """encode() without counting a miss, for writing entries ahead of requests.
+
+        value is JSON bytes, a Pydantic model or anything orjson serializes.
+        """
+        if hasattr(value, "model_dump"):
+            value = value.model_dump(mode="json")
+        if not isinstance(value, bytes):
+            value = orjson.dumps(value)
+        return base64.b64encode(zlib.compress(value)).decode("ascii")
+
+    @classmethod
+    def unpack(cls, value):
+        """The JSON bytes of a stored value."""
+        if isinstance(value, str):
+            value = value.encode("ascii")
+        return zlib.decompress(base64.b64decode(value))
+
+    @classmethod
+    def decode(cls, value):
+        return orjson.loads(cls.unpack(value))
+
+    @classmethod
+    def decode_as_type(cls, value, *, type_=None):
+        cls.stats["hits"] += 1
+        metrics.record_cache_lookup(cls.name, "redis_hit")
+        return cls.unpack(value)
+
+    @classmethod
+    def hit_ratio(cls):
+        total = cls.stats["hits"] + cls.stats["misses"]
+        return cls.stats["hits"] / total if total else 0.0
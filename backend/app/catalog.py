@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import re
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateIndex
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Categories kept per destination; restaurants are additionally keyed by cuisine
+CATEGORIES = ("attraction", "restaurant", "hotel")
+
+def normalize_destination(destination: str) -> str:
+    return re.sub(r"\s+", " ", destination).strip().casefold()
+
+def normalize_cuisine(food_preference: str) -> str:
+    return re.sub(r"\s+", " ", food_preference or "").strip().casefold()
+
+# Spellings of the same destination that should share cached responses,
+# keyed by their normalized form. DESTINATION_ALIASES_FILE may point to a JSON
+# object with more entries.
+DESTINATION_ALIASES = {
+    "paris, france": "paris",
+    "london, uk": "london",
+    "london, england": "london",
+    "rome, italy": "rome",
+    "roma": "rome",
+    "nyc": "new york",
+    "new york city": "new york",
+    "new york, ny": "new york",
+    "new york, usa": "new york",
+    "tokyo, japan": "tokyo",
+    "barcelona, spain": "barcelona",
+    "dubai, uae": "dubai",
+    "sf": "san francisco",
+    "la": "los angeles",
+    "bombay": "mumbai",
+    "bangalore": "bengaluru",
+}
+DESTINATION_ALIASES_FILE = os.getenv("DESTINATION_ALIASES_FILE")
+if DESTINATION_ALIASES_FILE:
+    try:
+        with open(DESTINATION_ALIASES_FILE) as f:
+            DESTINATION_ALIASES.update(
+                {normalize_destination(alias): normalize_destination(name) for alias, name in json.load(f).items()}
+            )
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load destination aliases from {DESTINATION_ALIASES_FILE}: {str(e)}")
+
+# Food preferences share cached responses when they differ only in filler
+# words, exact synonyms and word order, so "French", "french cuisine" and
+# "authentic French food" land together while "vegetarian italian" and
+# "vegetarian indian" stay apart
+FOOD_SYNONYMS = {
+    "veggie": "vegetarian",
+    "veg": "vegetarian",
+    "street": "street food",
+    "anything": "any",
+    "everything": "any",
+}
+# Words that never change the bucket
+FOOD_FILLER_WORDS = {"food", "foods", "cuisine", "cuisines", "dishes", "meals", "style", "authentic", "local", "traditional", "only", "please"}
+# "non-veg", "no seafood" and "without pork" negate the word that follows,
+# "fish-free" the word before
+FOOD_NEGATIONS = {"no", "non", "not", "without"}
+
+def canonical_destination(destination: str) -> str:
+    """normalize_destination, with punctuation tidied and aliases resolved."""
+    key = normalize_destination(destination).strip(" .,")
+    key = re.sub(r"\s*,\s*", ", ", key)
+    return DESTINATION_ALIASES.get(key, key)
+
+def food_bucket(food_preference: str) -> str:
+    """Coarse food preference used to share cached responses between phrasings."""
+    words = re.findall(r"[^\W_]+", normalize_cuisine(food_preference))
+    terms = set()
+    negated = False
+    for position, word in enumerate(words):
+        if word in FOOD_NEGATIONS:
+            negated = True
+            continue
+        if word == "free" or word in FOOD_FILLER_WORDS:
+            continue
+        word = FOOD_SYNONYMS.get(word, word)
+        if negated or words[position + 1:position + 2] == ["free"]:
+            terms.add(f"no {word}")
+        elif word != "any":
+            terms.add(word)
+        negated = False
+    return " ".join(sorted(terms)) or "any"
+
+def _cuisine_for(category, cuisine):
+    return cuisine if category == "restaurant" else ""
+
+def load_candidates(destination_key: str, cuisine: str):
+    """Return {category: [place, ...]} for the categories stored for this destination."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.CatalogPlace)
+            .filter(models.CatalogPlace.destination_key == destination_key)
+            .filter(
+                ((models.CatalogPlace.category == "restaurant") & (models.CatalogPlace.cuisine == cuisine))
+                | ((models.CatalogPlace.category != "restaurant") & (models.CatalogPlace.cuisine == ""))
+            )
+            .order_by(models.CatalogPlace.category, models.CatalogPlace.position)
+            .all()
+        )
+    finally:
+        db.close()
+
+    candidates = {}
+    for row in rows:
+        candidates.setdefault(row.category, []).append(dict(row.data))
+    return candidates
+
+def upgrade_schema(connection):
+    """Add the unique place index to a catalog_places table that predates it.
+
+    Duplicate places left by earlier concurrent refreshes are removed first.
+    Safe to run on every startup.
+    """
+    index = next(index for index in models.CatalogPlace.__table__.indexes if index.name == "ix_catalog_places_place")
+    connection.execute(text(
+        "DELETE FROM catalog_places WHERE id NOT IN "
+        "(SELECT MIN(id) FROM catalog_places GROUP BY destination_key, category, cuisine, place_id)"
+    ))
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+# Columns of a stored place that a refresh overwrites
+_REFRESHED_COLUMNS = ("destination", "position", "name", "rating", "lat", "lng", "data", "refreshed_at")
+
+def store_candidates(destination: str, cuisine: str, candidates):
+    """Replace the stored places for each category in candidates in one transaction.
+
+    Places are upserted on (destination, category, cuisine, place_id), so
+    concurrent refreshes of the same destination never store a place twice.
+    """
+    destination_key = normalize_destination(destination)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        for category, places in candidates.items():
+            if not places:
+                continue
+            # Places API results can repeat a place; keep its first position
+            places = list({place['place_id']: place for place in reversed(places)}.values())[::-1]
+            db.query(models.CatalogPlace).filter(
+                models.CatalogPlace.destination_key == destination_key,
+                models.CatalogPlace.category == category,
+                models.CatalogPlace.cuisine == _cuisine_for(category, cuisine),
+                models.CatalogPlace.place_id.notin_([place['place_id'] for place in places]),
+            ).delete(synchronize_session=False)
+            statement = insert(models.CatalogPlace).values([
+                {
+                    "destination_key": destination_key,
+                    "destination": destination.strip(),
+                    "category": category,
+                    "cuisine": _cuisine_for(category, cuisine),
+                    "position": position,
+                    "place_id": place['place_id'],
+                    "name": place.get('name'),
+                    "rating": place.get('rating'),
+                    "lat": place.get('location', {}).get('lat'),
+                    "lng": place.get('location', {}).get('lng'),
+                    "data": place,
+                    "refreshed_at": now,
+                }
+                for position, place in enumerate(places)
+            ])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["destination_key", "category", "cuisine", "place_id"],
+                set_={column: statement.excluded[column] for column in _REFRESHED_COLUMNS},
+            ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def stale_entries(max_age: timedelta, limit: int):
+    """Return up to limit (destination, cuisine) pairs not refreshed within max_age."""
+    cutoff = datetime.utcnow() - max_age
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.CatalogPlace.destination, models.CatalogPlace.cuisine)
+            .group_by(models.CatalogPlace.destination, models.CatalogPlace.cuisine)
+            .having(func.min(models.CatalogPlace.refreshed_at) < cutoff)
+            .order_by(func.min(models.CatalogPlace.refreshed_at))
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+    return [(row.destination, row.cuisine) for row in rows]
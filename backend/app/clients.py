@@ -0,0 +1,64 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_AI_API_KEY = os.getenv("GOOGLE_AI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro-002")
+
+# Registry of external SDK clients. Each client is built by its factory on
+# first use and then shared, so importing the app never pulls in heavy SDKs
+# or talks to the network. Tests and benchmarks swap clients with override().
+_factories = {}
+_instances = {}
+# Model handles built from the "gemini" client, by model name
+_models = {}
+_lock = threading.Lock()
+
+def register(name, factory):
+    """Register a zero-argument factory that builds the client called name."""
+    _factories[name] = factory
+
+def get(name):
+    """Return the shared client called name, creating it on first use."""
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _instances:
+            logger.debug(f"Initializing client {name}")
+            _instances[name] = _factories[name]()
+        return _instances[name]
+
+def override(name, instance):
+    """Use instance as the client called name (dependency injection for tests and benchmarks)."""
+    with _lock:
+        _instances[name] = instance
+        _models.clear()
+
+def reset(name=None):
+    """Drop one client, or all of them, so the next get() rebuilds it."""
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+        _models.clear()
+
+def _create_gemini():
+    # google.generativeai takes about a second to import, so only pay for it
+    # once a request actually needs Gemini
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_AI_API_KEY)
+    return genai.GenerativeModel
+
+register("gemini", _create_gemini)
+
+def generative_model(model_name=GEMINI_MODEL):
+    """Return the shared Gemini model handle for model_name, building it once."""
+    model = _models.get(model_name)
+    if model is None:
+        model = _models[model_name] = get("gemini")(model_name)
+    return model
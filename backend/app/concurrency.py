@@ -0,0 +1,51 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+# How many itinerary generations may run at once per worker, and how many
+# more may wait for a slot before new requests are turned away with a 503.
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "8"))
+MAX_QUEUED_GENERATIONS = int(os.getenv("MAX_QUEUED_GENERATIONS", "32"))
+
+class GenerationSaturated(Exception):
+    """Raised when both the running and the waiting slots are full."""
+
+class GenerationLimiter:
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._running = 0
+        self._waiting = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def saturated(self) -> bool:
+        return self._running >= self.max_concurrent and self._waiting >= self.max_queued
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.saturated:
+            raise GenerationSaturated(
+                f"{self._running} generations running and {self._waiting} queued"
+            )
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+generation_limiter = GenerationLimiter(MAX_CONCURRENT_GENERATIONS, MAX_QUEUED_GENERATIONS)
@@ -1,29 +1,44 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, passwords, schemas
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # bcrypt is deliberately slow; it runs in the password hashing processes
+    hashed_password = await passwords.hash_password(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # The flush assigns the id, so no refresh query is needed after commit
+    await db.flush()
+    await db.commit()
     return db_user
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    """Return the user if the password matches, upgrading a hash made with old parameters."""
+    db_user = await get_user_by_email(db, email)
+    if db_user is None:
+        await passwords.verify_unknown_user(password)
+        return None
+    valid, new_hash = await passwords.verify_password(password, db_user.hashed_password)
+    if not valid:
+        return None
+    if new_hash is not None:
+        db_user.hashed_password = new_hash
+        await db.commit()
+    return db_user
 
-def create_itinerary(db: Session, itinerary: schemas.ItineraryCreate, user_id: int):
-    db_itinerary = models.Itinerary(days=itinerary.days, owner_id=user_id)
+async def create_itinerary(db: AsyncSession, itinerary: schemas.ItineraryCreate, user_id: int):
+    db_itinerary = models.Itinerary(days=itinerary.model_dump()["days"], owner_id=user_id)
     db.add(db_itinerary)
-    db.commit()
-    db.refresh(db_itinerary)
+    await db.flush()
+    await db.commit()
     return db_itinerary
 
-def get_itinerary(db: Session, itinerary_id: int):
-    return db.query(models.Itinerary).filter(models.Itinerary.id == itinerary_id).first()
+async def get_itinerary(db: AsyncSession, itinerary_id: int):
+    return await db.get(models.Itinerary, itinerary_id)
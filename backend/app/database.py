@@ -1,11 +1,61 @@
+import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "postgresql://user:password@db/itinerary_db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db/itinerary_db")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Connection pool of the async engine used by request handlers: DB_POOL_SIZE
+# kept open, up to DB_MAX_OVERFLOW more under load, waiting at most
+# DB_POOL_TIMEOUT seconds for a free one
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Smaller pool of the sync engine used from worker threads (catalog, itinerary
+# store). Each worker process can hold DB_POOL_SIZE + DB_MAX_OVERFLOW +
+# DB_SYNC_POOL_SIZE + DB_SYNC_MAX_OVERFLOW connections (40 by default), so
+# keep workers x that under Postgres' max_connections
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "5"))
+DB_SYNC_MAX_OVERFLOW = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Recycle connections before Postgres or a proxy drops them, and check them on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def _async_url(url):
+    """The async driver URL for a sync DATABASE_URL (asyncpg for Postgres, aiosqlite for SQLite)."""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(SQLALCHEMY_DATABASE_URL)
+
+def _engine_args(url, pool_size, max_overflow):
+    if url.startswith("sqlite"):
+        # SQLite (used by the offline benchmarks) needs cross-thread access for asyncio.to_thread
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Sync engine for code that runs in worker threads (catalog, itinerary store)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, **_engine_args(SQLALCHEMY_DATABASE_URL, DB_SYNC_POOL_SIZE, DB_SYNC_MAX_OVERFLOW)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+# Async engine for request handlers; expire_on_commit=False so returned rows
+# can be serialized after commit without another round trip
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_engine_args(SQLALCHEMY_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
+Base = declarative_base()
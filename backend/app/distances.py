@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import httpx
+from .http_client import request_json
+from .resilience import UpstreamError, call_upstream
+from .cache import TwoTierCache
+from .geo import ROAD_FACTOR, geohash, haversine_pairs
+
+ORS_API_KEY = os.getenv("ORS_API_KEY")
+ORS_MATRIX_URL = "https://api.openrouteservice.org/v2/matrix/driving-car"
+# ORS rejects matrix requests with more than this many source x destination pairs
+ORS_MATRIX_MAX_ELEMENTS = int(os.getenv("ORS_MATRIX_MAX_ELEMENTS", "3500"))
+
+# Legs are cached by geohash-quantized endpoints; precision 8 is roughly 40m x 20m
+DISTANCE_CACHE_TTL = int(os.getenv("DISTANCE_CACHE_TTL", str(30 * 24 * 3600)))
+DISTANCE_CACHE_MAXSIZE = int(os.getenv("DISTANCE_CACHE_MAXSIZE", "10000"))
+DISTANCE_CACHE_PRECISION = int(os.getenv("DISTANCE_CACHE_PRECISION", "8"))
+
+# Legs whose estimated road distance is below this many km are not sent to ORS
+ROAD_ROUTING_MIN_KM = float(os.getenv("ROAD_ROUTING_MIN_KM", "1.0"))
+
+DISTANCE_FAILED = "Distance calculation failed"
+LOCATION_UNAVAILABLE = "Location data unavailable"
+
+logger = logging.getLogger(__name__)
+
+distance_cache = TwoTierCache("distance", DISTANCE_CACHE_TTL, DISTANCE_CACHE_MAXSIZE)
+
+def leg_cache_key(origin, destination):
+    """Cache key for a leg between two (lng, lat) coordinates."""
+    return (f"{geohash(origin[1], origin[0], DISTANCE_CACHE_PRECISION)}:"
+            f"{geohash(destination[1], destination[0], DISTANCE_CACHE_PRECISION)}")
+
+def format_distance(meters):
+    return f"{meters / 1000:.2f} km"
+
+def estimate_road_km(legs):
+    """Approximate road distances in km for (lng, lat) legs from great-circle distance."""
+    if not legs:
+        return []
+    origins = [(origin[1], origin[0]) for origin, _ in legs]
+    destinations = [(destination[1], destination[0]) for _, destination in legs]
+    return (haversine_pairs(origins, destinations) * ROAD_FACTOR).tolist()
+
+def _coordinate(location):
+    return (float(location['lng']), float(location['lat']))
+
+async def _matrix_request(locations, sources, destinations):
+    headers = {
+        'Accept': 'application/json; charset=utf-8',
+        'Authorization': ORS_API_KEY,
+        'Content-Type': 'application/json; charset=utf-8'
+    }
+    body = {
+        "locations": [list(coordinate) for coordinate in locations],
+        "sources": sources,
+        "destinations": destinations,
+        "metrics": ["distance"],
+        "units": "m"
+    }
+
+    try:
+        data = await call_upstream("ors", lambda: request_json("POST", ORS_MATRIX_URL, json=body, headers=headers))
+
+        if 'distances' not in data:
+            logger.error("Unexpected response structure from ORS matrix API")
+            return None
+        return data['distances']
+    except (httpx.HTTPError, UpstreamError) as e:
+        logger.error(f"Error calculating distance matrix using ORS API: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error in ORS matrix request: {str(e)}")
+        return None
+
+async def calculate_distances(legs):
+    """Resolve (origin, destination) coordinate legs with batched ORS matrix calls.
+
+    Coordinates are (lng, lat) tuples. Returns a dict mapping each distinct leg
+    to its distance in meters, or None where ORS could not route it. Legs found
+    in the distance cache are not sent to ORS.
+    """
+    legs = list(dict.fromkeys(legs))
+    if not legs:
+        return {}
+
+    keys = {leg: leg_cache_key(*leg) for leg in legs}
+    cached = await distance_cache.get_many(list(set(keys.values())))
+    distances = {leg: cached[key] for leg, key in keys.items() if key in cached}
+    legs = [leg for leg in legs if leg not in distances]
+    if not legs:
+        return distances
+
+    locations = list(dict.fromkeys(coordinate for leg in legs for coordinate in leg))
+    index = {coordinate: i for i, coordinate in enumerate(locations)}
+    sources = list(dict.fromkeys(index[origin] for origin, _ in legs))
+    destinations = list(dict.fromkeys(index[destination] for _, destination in legs))
+
+    # Split the sources so each request stays under the ORS element limit
+    chunk_size = max(1, ORS_MATRIX_MAX_ELEMENTS // len(destinations))
+    chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+    logger.info(f"Resolving {len(legs)} legs with {len(chunks)} ORS matrix request(s)")
+    matrices = await asyncio.gather(*(_matrix_request(locations, chunk, destinations) for chunk in chunks))
+
+    row_of = {}
+    for chunk, matrix in zip(chunks, matrices):
+        for row, source in enumerate(chunk):
+            row_of[source] = matrix[row] if matrix else None
+    column_of = {destination: column for column, destination in enumerate(destinations)}
+
+    resolved = {}
+    for origin, destination in legs:
+        row = row_of[index[origin]]
+        distances[(origin, destination)] = row[column_of[index[destination]]] if row else None
+        if distances[(origin, destination)] is not None:
+            resolved[keys[(origin, destination)]] = distances[(origin, destination)]
+    await distance_cache.set_many(resolved)
+    return distances
+
+async def annotate_distances(itinerary_data):
+    """Fill in the distance to the next stop for every activity across all days at once.
+
+    Distances are stored as numbers in distance_to_next_km; road distances
+    come from ORS, and short legs and legs ORS cannot resolve get a
+    great-circle estimate flagged with distance_estimated. Stops without a
+    distance get the reason in distance_to_next.
+    """
+    pending = []
+    for day, activities in itinerary_data.items():
+        for i in range(len(activities) - 1):
+            origin = activities[i].get('location', {})
+            destination = activities[i+1].get('location', {})
+            if not (origin and destination):
+                activities[i]['distance_to_next'] = LOCATION_UNAVAILABLE
+                continue
+            try:
+                pending.append((activities[i], (_coordinate(origin), _coordinate(destination))))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Invalid location in itinerary: {str(e)}")
+                activities[i]['distance_to_next'] = DISTANCE_FAILED
+
+        if activities:
+            activities[-1]['distance_to_next'] = "N/A"
+
+    # Short legs are estimated locally; only the rest go to ORS, and any leg ORS
+    # cannot resolve falls back to the estimate as well
+    estimates = dict(zip((leg for _, leg in pending), estimate_road_km([leg for _, leg in pending])))
+    routed = [leg for leg, km in estimates.items() if km >= ROAD_ROUTING_MIN_KM]
+    distances = await calculate_distances(routed)
+    for activity, leg in pending:
+        meters = distances.get(leg)
+        if meters is not None:
+            activity['distance_to_next_km'] = round(meters / 1000, 3)
+            activity['distance_estimated'] = False
+        else:
+            activity['distance_to_next_km'] = round(estimates[leg], 3)
+            activity['distance_estimated'] = True
+    return itinerary_data
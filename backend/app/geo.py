@@ -0,0 +1,73 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Straight-line distance is scaled by ROAD_FACTOR to approximate road distance
+ROAD_FACTOR = 1.3
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lng: float, precision: int = 8) -> str:
+    """Encode a coordinate as a geohash string of the given length."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def haversine_matrix(origins, destinations=None):
+    """Great-circle distances in km between every origin and destination.
+
+    Points are (lat, lng) pairs; with destinations omitted the square matrix
+    of origins against themselves is returned. Computed in one vectorized
+    pass, so a full itinerary costs microseconds.
+    """
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = origins if destinations is None else np.radians(
+        np.asarray(destinations, dtype=float).reshape(-1, 2)
+    )
+    lat1 = origins[:, 0:1]
+    lng1 = origins[:, 1:2]
+    lat2 = destinations[:, 0]
+    lng2 = destinations[:, 1]
+    h = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+def haversine_pairs(origins, destinations):
+    """Great-circle distances in km between origins[i] and destinations[i]."""
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    dlat = destinations[:, 0] - origins[:, 0]
+    dlng = destinations[:, 1] - origins[:, 1]
+    h = (np.sin(dlat / 2) ** 2
+         + np.cos(origins[:, 0]) * np.cos(destinations[:, 0]) * np.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+def haversine_km(a, b):
+    """Great-circle distance in km between two (lat, lng) points."""
+    return float(haversine_pairs([a], [b])[0])
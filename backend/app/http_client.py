@@ -0,0 +1,42 @@
+import os
+import httpx
+
+# Shared pooled async client used for all outbound HTTP calls (Places, ORS).
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _client
+
+def set_http_client(client: httpx.AsyncClient):
+    """Use client for all outbound calls, e.g. one with a stub transport."""
+    global _client
+    _client = client
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+async def request_json(method, url, **kwargs):
+    """Send a request with the shared client and return the decoded JSON body.
+
+    Raises httpx.HTTPStatusError for error statuses so callers (and the
+    resilience layer) see them as failures.
+    """
+    response = await get_http_client().request(method, url, **kwargs)
+    response.raise_for_status()
+    return response.json()
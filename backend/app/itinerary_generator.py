@@ -2,44 +2,75 @@
 # Make sure to adapt the function to return a list of dictionaries
 # where each dictionary represents a day with activities
 
-import googlemaps
-import google.generativeai as genai
-from datetime import datetime, timedelta
-from geopy.distance import geodesic
-from geopy.distance import great_circle
+import asyncio
+from collections import deque
+from datetime import timedelta
 import json
 import os
-import requests
-from geopy.geocoders import Nominatim
-from requests.exceptions import ReadTimeout, ConnectionError
-from google.generativeai import GenerativeModel
-from itertools import combinations
-import re
-import os
-from dotenv import load_dotenv
+import httpx
 import logging
-from tenacity import retry, stop_after_attempt, wait_fixed
-
-load_dotenv()
-print("GOOGLE_MAPS_API_KEY:", os.getenv('GOOGLE_MAPS_API_KEY'))
+from . import metrics
+from . import clients
+from .prompts import (
+    build_days_prompt, build_descriptions_prompt, build_itinerary_prompt,
+    descriptions_generation_config, itinerary_generation_config, DESCRIPTION_ID_PREFIX, PROMPT_VERSION,
+)
+from .http_client import request_json
+from .resilience import UpstreamError, call_upstream, request_deadline
+from . import catalog
+from .cache import StaleWhileRevalidateCache
+from .planner import assign_places_to_days, plan_itinerary
+from .llm_parser import IncrementalDayParser, parse_llm_json
+from .distances import annotate_distances, distance_cache, format_distance, leg_cache_key
 
 # Load environment variables
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-if not GOOGLE_MAPS_API_KEY:
-    raise ValueError("GOOGLE_MAPS_API_KEY is not set in the environment variables")
-GOOGLE_AI_API_KEY = os.getenv("GOOGLE_AI_API_KEY")
 ORS_API_KEY = os.getenv("ORS_API_KEY")
+# Maximum number of place details lookups in flight at once per itinerary
+PLACE_DETAILS_CONCURRENCY = int(os.getenv("PLACE_DETAILS_CONCURRENCY", "5"))
+# Place details are served from cache for PLACE_DETAILS_CACHE_TTL, then served
+# stale for up to PLACE_DETAILS_STALE_TTL while being refreshed in the background
+PLACE_DETAILS_CACHE_TTL = int(os.getenv("PLACE_DETAILS_CACHE_TTL", str(24 * 3600)))
+PLACE_DETAILS_STALE_TTL = int(os.getenv("PLACE_DETAILS_STALE_TTL", str(7 * 24 * 3600)))
+PLACE_DETAILS_NEGATIVE_TTL = int(os.getenv("PLACE_DETAILS_NEGATIVE_TTL", "3600"))
+PLACE_DETAILS_CACHE_MAXSIZE = int(os.getenv("PLACE_DETAILS_CACHE_MAXSIZE", "5000"))
+# Catalog entries older than PLACE_CATALOG_MAX_AGE are re-fetched by the
+# background refresher, which runs every PLACE_CATALOG_REFRESH_INTERVAL seconds
+PLACE_CATALOG_MAX_AGE = timedelta(seconds=int(os.getenv("PLACE_CATALOG_MAX_AGE", str(7 * 24 * 3600))))
+PLACE_CATALOG_REFRESH_INTERVAL = int(os.getenv("PLACE_CATALOG_REFRESH_INTERVAL", "3600"))
+PLACE_CATALOG_REFRESH_BATCH = int(os.getenv("PLACE_CATALOG_REFRESH_BATCH", "20"))
+
+# "local" plans routes and timings in-process and only asks Gemini for
+# descriptions; "llm" has Gemini write the whole itinerary
+ITINERARY_PLANNER = os.getenv("ITINERARY_PLANNER", "local")
+# Identifies how an itinerary was produced; stored itineraries are only
+# served to requests with the same version
+GENERATOR_VERSION = f"{ITINERARY_PLANNER}/{PROMPT_VERSION}/{clients.GEMINI_MODEL}"
+
+# Trips of at least PARALLEL_GENERATION_MIN_DAYS days are generated with
+# concurrent Gemini calls of PARALLEL_DAYS_PER_CALL days each
+PARALLEL_GENERATION_MIN_DAYS = int(os.getenv("PARALLEL_GENERATION_MIN_DAYS", "4"))
+PARALLEL_DAYS_PER_CALL = int(os.getenv("PARALLEL_DAYS_PER_CALL", "2"))
+PARALLEL_GENERATION_CONCURRENCY = int(os.getenv("PARALLEL_GENERATION_CONCURRENCY", "4"))
+PARALLEL_DAY_ATTEMPTS = int(os.getenv("PARALLEL_DAY_ATTEMPTS", "3"))
 
-# Initialize clients and services
-geolocator = Nominatim(user_agent="itinerary_generator")
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-genai.configure(api_key=GOOGLE_AI_API_KEY)
+# Text search used for each catalog category
+PLACE_SEARCHES = {
+    "attraction": "tourist attraction",
+    "restaurant": "restaurant",
+    "hotel": "hotel",
+}
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_places(destination, place_type, food_preference=None):
+place_details_cache = StaleWhileRevalidateCache(
+    "place_details", PLACE_DETAILS_CACHE_TTL, PLACE_DETAILS_STALE_TTL, PLACE_DETAILS_CACHE_MAXSIZE
+)
+# place_ids with a background refresh in flight, and the tasks running them
+_refreshing = set()
+_refresh_tasks = set()
+
+async def get_places(destination, place_type, food_preference=None):
     base_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
     
     if place_type == "restaurant" and food_preference:
@@ -53,9 +84,7 @@ def get_places(destination, place_type, food_preference=None):
     }
     
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = await call_upstream("google_places", lambda: request_json("GET", base_url, params=params))
         
         if data['status'] != 'OK':
             logger.error(f"Error in Google Places API: {data['status']}")
@@ -74,12 +103,20 @@ def get_places(destination, place_type, food_preference=None):
         
         return places
     
-    except requests.RequestException as e:
+    except (httpx.HTTPError, UpstreamError) as e:
         logger.error(f"Error fetching places from Google Maps API: {str(e)}")
         return []
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def calculate_distance(origin, destination):
+async def calculate_distance(origin, destination):
+    try:
+        cache_key = leg_cache_key((origin['lng'], origin['lat']), (destination['lng'], destination['lat']))
+    except KeyError as e:
+        logger.error(f"KeyError in calculate_distance: {str(e)}")
+        return "Distance calculation failed"
+    cached = await distance_cache.get(cache_key)
+    if cached is not None:
+        return format_distance(cached)
+
     base_url = "https://api.openrouteservice.org/v2/directions/driving-car"
     headers = {
         'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
@@ -91,9 +128,7 @@ def calculate_distance(origin, destination):
     }
     
     try:
-        response = requests.post(base_url, json=body, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = await call_upstream("ors", lambda: request_json("POST", base_url, json=body, headers=headers))
         
         # Log the entire response for debugging
         logger.debug(f"ORS API Response: {data}")
@@ -102,8 +137,8 @@ def calculate_distance(origin, destination):
         if 'routes' in data and data['routes'] and 'summary' in data['routes'][0]:
             summary = data['routes'][0]['summary']
             if 'distance' in summary:
-                distance_km = summary['distance'] / 1000
-                return f"{distance_km:.2f} km"
+                await distance_cache.set(cache_key, summary['distance'])
+                return format_distance(summary['distance'])
             else:
                 logger.error("Distance key not found in the response summary")
                 return "Distance calculation failed"
@@ -111,7 +146,7 @@ def calculate_distance(origin, destination):
             logger.error("Unexpected response structure from ORS API")
             return "Distance calculation failed"
     
-    except requests.RequestException as e:
+    except (httpx.HTTPError, UpstreamError) as e:
         logger.error(f"Error calculating distance using ORS API: {str(e)}")
         return "Distance calculation failed"
     except KeyError as e:
@@ -122,8 +157,8 @@ def calculate_distance(origin, destination):
         return "Distance calculation failed"
 
 # Add this function to get more details about a place
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def get_place_details(place_id):
+async def _request_place_details(place_id):
+    """Return (status, details); status is the API status, or None on HTTP errors."""
     base_url = "https://maps.googleapis.com/maps/api/place/details/json"
     
     params = {
@@ -133,13 +168,11 @@ def get_place_details(place_id):
     }
     
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = await call_upstream("google_place_details", lambda: request_json("GET", base_url, params=params))
         
         if data['status'] != 'OK':
             logger.error(f"Error in Google Place Details API: {data['status']}")
-            return None
+            return data['status'], None
         
         result = data['result']
         details = {
@@ -151,121 +184,377 @@ def get_place_details(place_id):
             'review': result.get('reviews', [{}])[0].get('text', 'No review available')
         }
         
-        return details
+        return 'OK', details
     
-    except requests.RequestException as e:
+    except (httpx.HTTPError, UpstreamError) as e:
         logger.error(f"Error fetching place details from Google Maps API: {str(e)}")
+        return None, None
+
+async def get_place_details(place_id):
+    return (await get_place_details_many([place_id])).get(place_id)
+
+async def _fetch_and_cache_place_details(place_ids):
+    semaphore = asyncio.Semaphore(PLACE_DETAILS_CONCURRENCY)
+
+    async def fetch(place_id):
+        async with semaphore:
+            return await _request_place_details(place_id)
+
+    responses = await asyncio.gather(*(fetch(place_id) for place_id in place_ids))
+    found, missing = {}, []
+    for place_id, (status, details) in zip(place_ids, responses):
+        if status == 'OK':
+            found[place_id] = details
+        elif status is not None:
+            # The API answered but has no details for this place; cache that too
+            missing.append(place_id)
+    await place_details_cache.set_many(found)
+    await place_details_cache.set_many({place_id: None for place_id in missing}, PLACE_DETAILS_NEGATIVE_TTL)
+    return {place_id: details for place_id, (_, details) in zip(place_ids, responses)}
+
+async def _refresh_place_details(place_ids):
+    try:
+        # Runs past the request that triggered it, so not bound by its deadline
+        with request_deadline(None):
+            await _fetch_and_cache_place_details(place_ids)
+    except Exception as e:
+        logger.warning(f"Background refresh of place details failed: {str(e)}")
+    finally:
+        _refreshing.difference_update(place_ids)
+
+async def get_place_details_many(place_ids):
+    """Look up details for many places with one cache round trip.
+
+    Cached details are returned immediately (stale ones are refreshed in the
+    background) and only the misses are fetched from the Places API.
+    Returns a dict of place_id -> details, or None where unavailable.
+    """
+    place_ids = list(dict.fromkeys(place_ids))
+    cached = await place_details_cache.get_many(place_ids)
+    results = {place_id: details for place_id, (details, _) in cached.items()}
+
+    stale = [place_id for place_id, (_, is_stale) in cached.items()
+             if is_stale and place_id not in _refreshing]
+    if stale:
+        _refreshing.update(stale)
+        task = asyncio.create_task(_refresh_place_details(stale))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+
+    misses = [place_id for place_id in place_ids if place_id not in cached]
+    if misses:
+        results.update(await _fetch_and_cache_place_details(misses))
+    return results
+
+async def search_places(destination, food_preference, categories=catalog.CATEGORIES):
+    """Run the text searches for categories at once, then look up all place details in bulk.
+
+    Returns {category: [place, ...]} with details merged into each place.
+    """
+    with metrics.stage("place_search"):
+        results = await asyncio.gather(*(
+            get_places(destination, PLACE_SEARCHES[category], food_preference if category == "restaurant" else None)
+            for category in categories
+        ))
+    found = dict(zip(categories, results))
+
+    all_places = [place for places in results for place in places]
+    with metrics.stage("place_details"):
+        details = await get_place_details_many([place['place_id'] for place in all_places])
+    for place in all_places:
+        if details.get(place['place_id']):
+            place.update(details[place['place_id']])
+
+    return found
+
+async def fetch_places(destination, food_preference):
+    found = await search_places(destination, food_preference)
+    return found["attraction"], found["restaurant"], found["hotel"]
+
+async def get_candidates(destination, food_preference):
+    """Return (attractions, restaurants, accommodations) for a destination.
+
+    Categories already in the place catalog are read from Postgres; only the
+    missing ones are searched for and then stored for the next request.
+    """
+    destination_key = catalog.normalize_destination(destination)
+    cuisine = catalog.normalize_cuisine(food_preference)
+    try:
+        with metrics.stage("catalog_lookup"):
+            candidates = await asyncio.to_thread(catalog.load_candidates, destination_key, cuisine)
+    except Exception as e:
+        logger.warning(f"Place catalog lookup failed for {destination_key}: {str(e)}")
+        candidates = {}
+
+    missing = [category for category in catalog.CATEGORIES if category not in candidates]
+    if missing:
+        logger.info(f"Place catalog miss for {destination_key} ({cuisine}): {missing}")
+        found = await search_places(destination, food_preference, missing)
+        candidates.update(found)
+        try:
+            with metrics.stage("catalog_store"):
+                await asyncio.to_thread(catalog.store_candidates, destination, cuisine, found)
+        except Exception as e:
+            logger.warning(f"Failed to store place catalog for {destination_key}: {str(e)}")
+
+    return candidates["attraction"], candidates["restaurant"], candidates["hotel"]
+
+async def refresh_place_catalog():
+    """Re-fetch a batch of catalog entries older than PLACE_CATALOG_MAX_AGE."""
+    stale = await asyncio.to_thread(catalog.stale_entries, PLACE_CATALOG_MAX_AGE, PLACE_CATALOG_REFRESH_BATCH)
+    for destination, cuisine in stale:
+        categories = ["restaurant"] if cuisine else ["attraction", "hotel"]
+        found = await search_places(destination, cuisine, categories)
+        await asyncio.to_thread(catalog.store_candidates, destination, cuisine, found)
+    if stale:
+        logger.info(f"Refreshed {len(stale)} place catalog entries")
+
+async def run_place_catalog_refresher():
+    while True:
+        await asyncio.sleep(PLACE_CATALOG_REFRESH_INTERVAL)
+        try:
+            await refresh_place_catalog()
+        except Exception as e:
+            logger.exception(f"Place catalog refresh failed: {str(e)}")
+
+async def generate_content(model, prompt, **kwargs):
+    """Call Gemini through the resilience layer, recording latency and token usage."""
+    with metrics.stage("llm"):
+        response = await call_upstream("gemini", lambda: model.generate_content_async(prompt, **kwargs))
+    # A streamed response only has its usage once consumed; stream_itinerary records it
+    if not kwargs.get("stream"):
+        metrics.record_llm_usage(response)
+    return response
+
+def extract_itinerary_json(content_text):
+    """Return (data, failed) for the JSON object in the model output.
+
+    data holds every top-level entry that parsed (None if there is no JSON
+    object at all); failed lists the keys whose values could not be parsed.
+    """
+    with metrics.stage("json_extract"):
+        data, failed = parse_llm_json(content_text)
+    if data is None:
+        logger.error("No JSON content found in response.")
+        metrics.record_parse_failure("llm_json")
+    elif failed:
+        logger.error(f"Could not parse entries {failed} of the model output")
+        logger.debug(f"Problematic output: {content_text}")
+        metrics.record_parse_failure("llm_json", len(failed))
+    return data, failed
+
+async def describe_itinerary(destination, food_preference, itinerary_data):
+    """Fill in the description of every planned stop with one Gemini call.
+
+    Each distinct place is described once. If the call or parsing fails the
+    stops fall back to their review so the itinerary is still usable.
+    """
+    # Gemini sees short IDs (P1, P2, ...) rather than Google place IDs
+    short_ids = {}
+    places = {}
+    for activities in itinerary_data.values():
+        for stop in activities:
+            if stop['place_id'] not in short_ids:
+                short_ids[stop['place_id']] = f"{DESCRIPTION_ID_PREFIX}{len(short_ids) + 1}"
+                places[short_ids[stop['place_id']]] = (stop['place_name'], stop['activity'])
+
+    descriptions = {}
+    try:
+        model = clients.generative_model()
+        prompt = build_descriptions_prompt(destination, food_preference, places)
+        response = await generate_content(
+            model, prompt, generation_config=descriptions_generation_config(list(places))
+        )
+        descriptions = extract_itinerary_json(response.text)[0] or {}
+    except Exception as e:
+        logger.error(f"Failed to generate place descriptions: {str(e)}")
+
+    for activities in itinerary_data.values():
+        for stop in activities:
+            description = descriptions.get(short_ids[stop['place_id']])
+            stop['description'] = description if isinstance(description, str) else stop['review']
+            del stop['place_id']
+    return itinerary_data
+
+async def generate_days_parallel(destination, no_of_days, food_preference, attractions, restaurants, accommodations,
+                                 day_numbers=None):
+    """Generate the itinerary with concurrent smaller Gemini calls.
+
+    Attractions are clustered into one geographic group per day first, then
+    PARALLEL_DAYS_PER_CALL days are requested per call. Days missing from a
+    response are re-requested on their own, up to PARALLEL_DAY_ATTEMPTS
+    times. Pass day_numbers to generate only those days of the trip.
+    Returns None if any day could not be generated.
+    """
+    day_numbers = day_numbers or list(range(1, no_of_days + 1))
+    day_attractions = dict(zip(day_numbers, assign_places_to_days(attractions, len(day_numbers))))
+    accommodation = accommodations[:1]
+    model = clients.generative_model()
+    semaphore = asyncio.Semaphore(PARALLEL_GENERATION_CONCURRENCY)
+
+    async def generate_chunk(day_numbers):
+        days = {}
+        remaining = list(day_numbers)
+        for attempt in range(PARALLEL_DAY_ATTEMPTS):
+            prompt, places = build_days_prompt(
+                destination, no_of_days, remaining, food_preference, day_attractions, restaurants, accommodation
+            )
+            config = itinerary_generation_config([f"Day {day}" for day in remaining])
+            async with semaphore:
+                response = await generate_content(model, prompt, generation_config=config)
+            parsed = extract_itinerary_json(response.text)[0] or {}
+            for day in remaining:
+                activities = places.rehydrate_day(parsed.get(f"Day {day}"))
+                if activities:
+                    days[day] = activities
+            remaining = [day for day in remaining if day not in days]
+            if not remaining:
+                break
+            logger.warning(f"Regenerating days {remaining} (attempt {attempt + 2})")
+        return days
+
+    chunks = [
+        day_numbers[start:start + PARALLEL_DAYS_PER_CALL]
+        for start in range(0, len(day_numbers), PARALLEL_DAYS_PER_CALL)
+    ]
+    days = {}
+    for chunk_days in await asyncio.gather(*(generate_chunk(chunk) for chunk in chunks)):
+        days.update(chunk_days)
+
+    missing = [day for day in day_numbers if day not in days]
+    if missing:
+        logger.error(f"Failed to generate days {missing}")
+        return None
+    return {f"Day {day}": days[day] for day in day_numbers}
+
+async def regenerate_missing_days(destination, no_of_days, food_preference, itinerary_data,
+                                  attractions, restaurants, accommodations):
+    """Re-request only the days missing from (or unparseable in) itinerary_data.
+
+    The days that did come back are kept; the missing ones are planned from
+    the attractions those days don't already visit. Returns the completed
+    itinerary, or None if the missing days could not be generated either.
+    """
+    missing = [day for day in range(1, no_of_days + 1) if not itinerary_data.get(f"Day {day}")]
+    if not missing:
+        return itinerary_data
+    logger.warning(f"Regenerating days {missing} of the itinerary")
+    visited = {stop['place_name'] for activities in itinerary_data.values() for stop in activities}
+    unvisited = [place for place in attractions if place.get('name') not in visited]
+    regenerated = await generate_days_parallel(
+        destination, no_of_days, food_preference, unvisited or attractions, restaurants, accommodations,
+        day_numbers=missing,
+    )
+    if regenerated is None:
         return None
+    itinerary_data.update(regenerated)
+    return {f"Day {day}": itinerary_data[f"Day {day}"] for day in range(1, no_of_days + 1)}
 
-def generate_itinerary(destination: str, no_of_days: int, food_preference: str):
+async def generate_itinerary(destination: str, no_of_days: int, food_preference: str):
     try:
         logger.info(f"Starting itinerary generation for {destination}, {no_of_days} days, {food_preference}")
         
-        attractions = get_places(destination, "tourist attraction")
+        with metrics.stage("candidates"):
+            attractions, restaurants, accommodations = await get_candidates(destination, food_preference)
         logger.debug(f"Attractions: {attractions}")
-
-        restaurants = get_places(destination, "restaurant", food_preference)
         logger.debug(f"Restaurants: {restaurants}")
-
-        accommodations = get_places(destination, "hotel")
         logger.debug(f"Accommodations: {accommodations}")
 
-        # Get more details for each place
-        all_places = attractions + restaurants + accommodations
-        for place in all_places:
-            details = get_place_details(place['place_id'])
-            if details:
-                place.update(details)
-
-        attractions_data = json.dumps(attractions)
-        restaurants_data = json.dumps(restaurants)
-        accommodations_data = json.dumps(accommodations)
-
-        prompt = f"""
-        Generate a detailed, day-by-day itinerary for a trip to {destination} for {no_of_days} days.
-        The traveler prefers {food_preference} food.
-
-        Use the following data to create the itinerary:
-        Tourist Attractions: {attractions_data}
-        Restaurants: {restaurants_data}
-        Accommodations: {accommodations_data}
-
-        Instructions:
-        - Organize the itinerary based on the user's specified number of days.
-        - For each day, include breakfast, 2-3 tourist attractions, lunch, dinner, and accommodation.
-        - Consider proximity of locations and food preferences.
-        - Include timings, Google Maps URLs, website links, ratings, and brief descriptions.
-
-        Output Format:
-        Format the itinerary as a valid JSON object with a key for each day of the trip.
-        Each day should contain a list of activities structured as follows:
-        {{
-          "Day 1": [
-            {{
-              "time": "8:00 AM",
-              "activity": "Breakfast",
-              "place_name": "Restaurant Name",
-              "description": "Brief description",
-              "rating": 4.5,
-              "review": "Short review",
-              "google_maps_url": "https://maps.google.com/...",
-              "website_url": "https://example.com",
-              "estimated_travel_time": "N/A",
-              "location": {{"lat": 12.3456, "lng": 78.9012}}
-            }},
-            // ... more activities for Day 1
-          ],
-          // ... more days
-        }}
-        """
-
-        logger.debug("Sending prompt to Gemini model")
-        model = GenerativeModel('gemini-1.5-pro-002')
-        response = model.generate_content(prompt)
-        logger.debug(f"Received response from Gemini model: {response}")
-
-        content_text = response.text
-        logger.debug(f"Extracted content text: {content_text}")
-
-        json_text_match = re.search(r"{.*}", content_text, re.DOTALL)
-
-        if json_text_match:
-            json_text = json_text_match.group(0).strip()
-            logger.debug(f"Extracted JSON text: {json_text}")
-
-            try:
-                itinerary_data = json.loads(json_text)
-                logger.debug(f"Parsed itinerary data: {itinerary_data}")
-
-                for day, activities in itinerary_data.items():
-                    for i in range(len(activities) - 1):
-                        origin = activities[i].get('location', {})
-                        destination = activities[i+1].get('location', {})
-                        if origin and destination:
-                            distance = calculate_distance(origin, destination)
-                            activities[i]['distance_to_next'] = distance
-                        else:
-                            activities[i]['distance_to_next'] = "Location data unavailable"
-
-                    if activities:
-                        activities[-1]['distance_to_next'] = "N/A"
-
-                logger.info("Itinerary generation completed successfully")
-                return itinerary_data
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing JSON: {e}")
-                logger.error(f"Problematic JSON: {json_text}")
-                return None
+        if ITINERARY_PLANNER == "local":
+            with metrics.stage("planning"):
+                itinerary_data = plan_itinerary(no_of_days, attractions, restaurants, accommodations)
+            await describe_itinerary(destination, food_preference, itinerary_data)
+        elif no_of_days >= PARALLEL_GENERATION_MIN_DAYS:
+            itinerary_data = await generate_days_parallel(
+                destination, no_of_days, food_preference, attractions, restaurants, accommodations
+            )
         else:
-            logger.error("No JSON content found in response.")
+            prompt, places = build_itinerary_prompt(
+                destination, no_of_days, food_preference, attractions, restaurants, accommodations
+            )
+
+            logger.debug("Sending prompt to Gemini model")
+            model = clients.generative_model()
+            config = itinerary_generation_config([f"Day {day}" for day in range(1, no_of_days + 1)])
+            response = await generate_content(model, prompt, generation_config=config)
+            logger.debug(f"Received response from Gemini model: {response}")
+
+            content_text = response.text
+            logger.debug(f"Extracted content text: {content_text}")
+            itinerary_data, _ = extract_itinerary_json(content_text)
+            if itinerary_data is not None:
+                itinerary_data = await regenerate_missing_days(
+                    destination, no_of_days, food_preference, places.rehydrate(itinerary_data),
+                    attractions, restaurants, accommodations,
+                )
+
+        if itinerary_data is None:
             return None
+        logger.debug(f"Parsed itinerary data: {itinerary_data}")
+
+        with metrics.stage("distances"):
+            await annotate_distances(itinerary_data)
+
+        logger.info("Itinerary generation completed successfully")
+        return itinerary_data
     except Exception as e:
         logger.exception(f"Error in generate_itinerary: {str(e)}")
         raise
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def call_external_api():
-    # Your API call here
-    pass
+async def stream_itinerary(destination: str, no_of_days: int, food_preference: str):
+    """Yield (day, activities) pairs in order as Gemini streams them out.
+
+    Each day is annotated with distances as soon as it parses, while later
+    days are still being generated. Days that fail to parse or never arrive
+    are regenerated once the stream ends, as in generate_itinerary, and
+    yielded last; ValueError is raised if they can't be. Only the LLM planner
+    streams: the local planner has every day at once.
+    """
+    logger.info(f"Starting streamed itinerary generation for {destination}, {no_of_days} days, {food_preference}")
+    attractions, restaurants, accommodations = await get_candidates(destination, food_preference)
+    prompt, places = build_itinerary_prompt(
+        destination, no_of_days, food_preference, attractions, restaurants, accommodations
+    )
+
+    model = clients.generative_model()
+    config = itinerary_generation_config([f"Day {day}" for day in range(1, no_of_days + 1)])
+    response = await generate_content(model, prompt, stream=True, generation_config=config)
+    parser = IncrementalDayParser()
+    pending = deque()
+    streamed = {}
+    try:
+        async for chunk in response:
+            for day, stops in parser.feed(chunk.text):
+                activities = places.rehydrate_day(stops)
+                if activities is None:
+                    logger.error(f"Streamed entry {day} is not a list of activities")
+                    continue
+                annotation = asyncio.create_task(annotate_distances({day: activities}))
+                pending.append((day, annotation))
+            while pending and pending[0][1].done():
+                day, annotation = pending.popleft()
+                streamed[day] = annotation.result()[day]
+                yield day, streamed[day]
+
+        while pending:
+            day, annotation = pending.popleft()
+            streamed[day] = (await annotation)[day]
+            yield day, streamed[day]
+    finally:
+        for _, annotation in pending:
+            annotation.cancel()
 
+    metrics.record_llm_usage(response)
+    if parser.failed:
+        logger.error(f"Streamed itinerary had unparseable days: {parser.failed}")
 
+    completed = await regenerate_missing_days(
+        destination, no_of_days, food_preference, dict(streamed), attractions, restaurants, accommodations
+    )
+    if completed is None:
+        raise ValueError("Could not generate the days missing from the streamed itinerary")
+    regenerated = {day: activities for day, activities in completed.items() if day not in streamed}
+    if regenerated:
+        await annotate_distances(regenerated)
+        for day, activities in regenerated.items():
+            yield day, activities
@@ -0,0 +1,203 @@
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+import orjson
+# pydantic needs typing_extensions' TypedDict before Python 3.12
+from typing_extensions import TypedDict
+
+logger = logging.getLogger(__name__)
+
+# In-memory form of a finished itinerary at the response edge. Generation and
+# storage work on plain dicts (the form stored in the itineraries table);
+# responses are built from these slotted records and serialized with orjson,
+# instead of validating the dicts into Pydantic models and dumping those.
+# ActivityResponse is the one definition of an activity's API shape: schemas
+# validates input and documents responses with it, after repair_activity().
+
+_DISTANCE = re.compile(r"^\s*(~?)\s*(\d+(?:\.\d+)?)\s*km\s*$")
+
+def _number(value):
+    """Best-effort float from model output such as 4.5, "4.5" or "4.5/5"."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        if match:
+            return float(match.group())
+    return None
+
+def _location(location):
+    """(lat, lng) from a location dict with any of the usual key names, or None."""
+    if not isinstance(location, dict):
+        return None
+    lat = _number(location.get("lat", location.get("latitude")))
+    lng = _number(location.get("lng", location.get("lon", location.get("longitude"))))
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return (lat, lng)
+
+def _text(value, default):
+    if value is None:
+        return default
+    return value if isinstance(value, str) else str(value)
+
+def format_distance_km(km, estimated=False):
+    return f"{'~' if estimated else ''}{km:.2f} km"
+
+class ActivityResponse(TypedDict):
+    """An activity as the API accepts and returns it: the output of Activity.to_dict."""
+    time: str
+    activity: str
+    place_name: str
+    description: str
+    rating: Optional[float]
+    review: str
+    google_maps_url: str
+    website_url: Optional[str]
+    estimated_travel_time: str
+    location: Dict[str, float]
+    # Display form of distance_to_next_km, or why there is no distance
+    distance_to_next: Optional[str]
+    distance_to_next_km: Optional[float]
+    distance_estimated: bool
+
+def repair_activity(data):
+    """Return an activity dict with field-level defects repaired, in response shape.
+
+    Distances end up as distance_to_next_km / distance_estimated, with
+    distance_to_next as their display form (or the reason there is none).
+    Older stored itineraries with only "1.23 km" style strings are converted.
+    Data without a usable place_name is returned as is.
+    """
+    if not _usable(data):
+        return data
+    return Activity.from_dict(data).to_dict()
+
+# __slots__ are declared by hand rather than with dataclass(slots=True), which
+# needs Python 3.10 (the image runs 3.9)
+class Activity:
+    __slots__ = (
+        "place_name", "time", "activity", "description", "rating", "review", "google_maps_url",
+        "website_url", "estimated_travel_time", "location", "distance_to_next_km", "distance_estimated",
+        "distance_note",
+    )
+
+    def __init__(
+        self,
+        place_name: str,
+        time: str = "",
+        activity: str = "Activity",
+        description: str = "",
+        rating: Optional[float] = None,
+        review: str = "No review available",
+        google_maps_url: str = "",
+        website_url: Optional[str] = None,
+        estimated_travel_time: str = "N/A",
+        # (lat, lng)
+        location: Optional[Tuple[float, float]] = None,
+        # Road distance to the next stop; estimated for great-circle estimates
+        distance_to_next_km: Optional[float] = None,
+        distance_estimated: bool = False,
+        # Why there is no distance, e.g. "Location data unavailable"
+        distance_note: Optional[str] = None,
+    ):
+        self.place_name = place_name
+        self.time = time
+        self.activity = activity
+        self.description = description
+        self.rating = rating
+        self.review = review
+        self.google_maps_url = google_maps_url
+        self.website_url = website_url
+        self.estimated_travel_time = estimated_travel_time
+        self.location = location
+        self.distance_to_next_km = distance_to_next_km
+        self.distance_estimated = distance_estimated
+        self.distance_note = distance_note
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from an activity dict, repairing field-level defects (see repair_activity)."""
+        get = data.get
+        travel_time = _text(get("estimated_travel_time"), "N/A")
+        if travel_time.isdigit():
+            travel_time += " mins"
+        website_url = get("website_url")
+        rating = _number(get("rating"))
+
+        km = _number(get("distance_to_next_km"))
+        estimated = bool(get("distance_estimated"))
+        note = get("distance_to_next")
+        if km is None and note is not None:
+            match = _DISTANCE.match(str(note))
+            if match:
+                km = float(match.group(2))
+                estimated = bool(match.group(1))
+        return cls(
+            place_name=data["place_name"],
+            time=_text(get("time"), ""),
+            activity=_text(get("activity"), "Activity"),
+            description=_text(get("description"), "") or _text(get("review"), ""),
+            rating=rating if rating is not None and 0 <= rating <= 5 else None,
+            review=_text(get("review"), "No review available"),
+            google_maps_url=_text(get("google_maps_url"), ""),
+            website_url=website_url if isinstance(website_url, str) else None,
+            estimated_travel_time=travel_time,
+            location=_location(get("location")),
+            distance_to_next_km=km,
+            distance_estimated=estimated and km is not None,
+            distance_note=str(note) if km is None and note is not None else None,
+        )
+
+    def to_dict(self) -> ActivityResponse:
+        """The response shape, ActivityResponse."""
+        km = self.distance_to_next_km
+        return {
+            "time": self.time,
+            "activity": self.activity,
+            "place_name": self.place_name,
+            "description": self.description,
+            "rating": self.rating,
+            "review": self.review,
+            "google_maps_url": self.google_maps_url,
+            "website_url": self.website_url,
+            "estimated_travel_time": self.estimated_travel_time,
+            "location": {"lat": self.location[0], "lng": self.location[1]} if self.location else {},
+            "distance_to_next": format_distance_km(km, self.distance_estimated) if km is not None else self.distance_note,
+            "distance_to_next_km": km,
+            "distance_estimated": self.distance_estimated,
+        }
+
+def _usable(activity):
+    return isinstance(activity, dict) and isinstance(activity.get("place_name"), str) and activity["place_name"]
+
+class Itinerary:
+    __slots__ = ("days",)
+
+    def __init__(self, days: Dict[str, List[Activity]]):
+        self.days = days
+
+    @classmethod
+    def from_days(cls, days):
+        """Build from {day: [activity dict, ...]}, dropping activities without a place."""
+        itinerary = cls({})
+        for day, activities in days.items():
+            if not isinstance(activities, list):
+                activities = []
+            usable = [activity for activity in activities if _usable(activity)]
+            if len(usable) < len(activities):
+                logger.warning(f"Dropped {len(activities) - len(usable)} activities without a place")
+            itinerary.days[day] = [Activity.from_dict(activity) for activity in usable]
+        return itinerary
+
+    def day_response(self, day):
+        return {"activities": [activity.to_dict() for activity in self.days[day]]}
+
+    def to_response(self):
+        """The response shape of schemas.FullItinerary."""
+        return {"itinerary": {day: self.day_response(day) for day in self.days}}
+
+    def dumps(self):
+        return orjson.dumps(self.to_response())
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+from . import itinerary_generator, itinerary_store
+from .catalog import canonical_destination, food_bucket
+from .concurrency import generation_limiter
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Concurrent identical generations share one run, in-process and across workers
+itinerary_flight = SingleFlight(
+    "itinerary-flight",
+    lease_ttl=float(os.getenv("ITINERARY_FLIGHT_LEASE_TTL", "30")),
+    result_ttl=int(os.getenv("ITINERARY_FLIGHT_RESULT_TTL", "60")),
+    wait_timeout=float(os.getenv("ITINERARY_FLIGHT_WAIT_TIMEOUT", "60")),
+)
+
+async def generate_itinerary_once(destination: str, no_of_days: int, food_preference: str, generate=None):
+    """Stored itinerary for the trip, or generate it, sharing the run with concurrent identical requests.
+
+    Returns (itinerary_id, days): days is None if generation failed, and
+    itinerary_id None if the itinerary could not be stored. For a trip served
+    from a longer stored one, itinerary_id is the longer trip's.
+    generate(destination, no_of_days, food_preference) defaults to
+    itinerary_generator.generate_itinerary; the stream route passes one that
+    also hands out days as they are ready.
+    """
+    generate = generate or itinerary_generator.generate_itinerary
+    version = itinerary_generator.GENERATOR_VERSION
+    try:
+        stored = await asyncio.to_thread(
+            itinerary_store.load_itinerary, destination, no_of_days, food_preference, version
+        )
+    except Exception as e:
+        # The store is an optimization; generate rather than fail the request
+        logger.error(f"Failed to load stored itinerary: {str(e)}")
+        stored = None
+    if stored is not None:
+        return stored
+
+    async def run():
+        async with generation_limiter.slot():
+            itinerary_data = await generate(destination, no_of_days, food_preference)
+        if itinerary_data is None:
+            # None is not published, so followers elsewhere try for themselves
+            return None
+        if len(itinerary_data) < no_of_days:
+            # Don't keep serving a trip with days missing
+            logger.warning(f"Not storing itinerary with {len(itinerary_data)} of {no_of_days} days")
+        else:
+            try:
+                itinerary_id = await asyncio.to_thread(
+                    itinerary_store.store_itinerary, destination, no_of_days, food_preference, version, itinerary_data
+                )
+                return itinerary_id, itinerary_data
+            except Exception as e:
+                logger.error(f"Failed to store generated itinerary: {str(e)}")
+        return None, itinerary_data
+
+    key = f"{version}|{canonical_destination(destination)}|{no_of_days}|{food_bucket(food_preference)}"
+    return await itinerary_flight.do(key, run) or (None, None)
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import IntegrityError
+from . import metrics, models
+from .catalog import canonical_destination, food_bucket
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Stored itineraries older than this are regenerated rather than served
+ITINERARY_STORE_MAX_AGE = timedelta(seconds=int(os.getenv("ITINERARY_STORE_MAX_AGE", str(30 * 24 * 3600))))
+# Shorter trips are served from the first days of a stored trip at most this
+# many times as long; 0 turns that off
+ITINERARY_STORE_DERIVE_RATIO = float(os.getenv("ITINERARY_STORE_DERIVE_RATIO", "2"))
+
+def itinerary_hash(destination: str, no_of_days: int, food_preference: str, version: str) -> str:
+    """Canonical hash of a generation request: the same trip hashes the same however it is spelled.
+
+    Keyed like the response cache and single-flight (canonical destination,
+    food bucket), so requests sharing those also share a stored row.
+    """
+    key = json.dumps({
+        "destination": canonical_destination(destination),
+        "days": no_of_days,
+        "food": food_bucket(food_preference),
+        "version": version,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+# Columns this module added to the itineraries table, for databases created before them
+_STORE_COLUMNS = ("content_hash", "destination_key", "food_key", "no_of_days", "generator_version", "created_at")
+
+def upgrade_schema(connection):
+    """Add the store's columns and indexes to an itineraries table that predates them.
+
+    create_all() only creates missing tables. Safe to run on every startup
+    and from several workers at once.
+    """
+    table = models.Itinerary.__table__
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    if_not_exists = "IF NOT EXISTS " if connection.dialect.name == "postgresql" else ""
+    for name in _STORE_COLUMNS:
+        if name not in existing:
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            logger.info(f"Adding column {table.name}.{name}")
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{name} {column_type}"))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+def first_days(days, no_of_days):
+    """The first no_of_days days of a longer itinerary, or None if any is missing."""
+    keys = [f"Day {day}" for day in range(1, no_of_days + 1)]
+    if not all(key in days for key in keys):
+        return None
+    return {key: days[key] for key in keys}
+
+def load_itinerary(destination: str, no_of_days: int, food_preference: str, version: str):
+    """Return (itinerary_id, days) of a stored itinerary for this trip, or None.
+
+    An exact match is looked up by content hash. Failing that, the first
+    days of the shortest longer trip to the same place with the same food
+    preference and generator version are served instead, if it is at most
+    ITINERARY_STORE_DERIVE_RATIO times as long: the opening days of a much
+    longer trip are paced for that trip, not this one. A derived trip is not
+    stored separately; its itinerary_id is that of the longer trip.
+    """
+    cutoff = datetime.utcnow() - ITINERARY_STORE_MAX_AGE
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(models.Itinerary.id, models.Itinerary.days)
+            .filter(models.Itinerary.content_hash == itinerary_hash(destination, no_of_days, food_preference, version))
+            .filter(models.Itinerary.created_at >= cutoff)
+            .first()
+        )
+        if row is not None:
+            metrics.record_cache_lookup("itinerary_store", "hit")
+            return row.id, row.days
+
+        longer = (
+            db.query(models.Itinerary.id, models.Itinerary.days, models.Itinerary.no_of_days)
+            .filter(models.Itinerary.destination_key == canonical_destination(destination))
+            .filter(models.Itinerary.food_key == food_bucket(food_preference))
+            .filter(models.Itinerary.generator_version == version)
+            .filter(models.Itinerary.no_of_days > no_of_days)
+            .filter(models.Itinerary.no_of_days <= no_of_days * ITINERARY_STORE_DERIVE_RATIO)
+            .filter(models.Itinerary.created_at >= cutoff)
+            .order_by(models.Itinerary.no_of_days)
+            .first()
+        )
+    finally:
+        db.close()
+
+    if longer is not None:
+        days = first_days(longer.days, no_of_days)
+        if days is not None:
+            logger.info(f"Serving {no_of_days}-day trip from a stored {longer.no_of_days}-day itinerary")
+            metrics.record_cache_lookup("itinerary_store", "derived")
+            return longer.id, days
+    metrics.record_cache_lookup("itinerary_store", "miss")
+    return None
+
+def store_itinerary(destination: str, no_of_days: int, food_preference: str, version: str, days):
+    """Save a generated itinerary and return its id.
+
+    An identical stored copy is kept (and its age reset); an expired or different copy of
+    the same trip is replaced.
+    """
+    content_hash = itinerary_hash(destination, no_of_days, food_preference, version)
+    db = SessionLocal()
+    try:
+        existing = db.query(models.Itinerary).filter(models.Itinerary.content_hash == content_hash).first()
+        if existing is not None:
+            if existing.days == days:
+                existing.created_at = datetime.utcnow()
+                db.commit()
+                return existing.id
+            db.delete(existing)
+            db.flush()
+        itinerary = models.Itinerary(
+            days=days,
+            content_hash=content_hash,
+            destination_key=canonical_destination(destination),
+            food_key=food_bucket(food_preference),
+            no_of_days=no_of_days,
+            generator_version=version,
+            created_at=datetime.utcnow(),
+        )
+        db.add(itinerary)
+        db.flush()
+        itinerary_id = itinerary.id
+        db.commit()
+        return itinerary_id
+    except IntegrityError:
+        # Another worker stored the same trip first
+        db.rollback()
+        existing = db.query(models.Itinerary.id).filter(models.Itinerary.content_hash == content_hash).first()
+        return existing.id if existing is not None else None
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
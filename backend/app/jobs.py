@@ -0,0 +1,381 @@
+import asyncio
+from collections import OrderedDict, deque
+import ipaddress
+import json
+import logging
+import os
+import time
+import uuid
+from urllib.parse import urlsplit
+from .concurrency import GenerationSaturated
+from .http_client import get_http_client
+from .resilience import backoff_delay, remaining_time, request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Background itinerary generation. Jobs wait in one of the PRIORITIES lanes;
+# within a lane each user has their own FIFO and users are served round-robin,
+# so one client submitting a hundred jobs can't starve everyone else. API
+# callers only get the normal and low lanes; high is for the service's own jobs.
+PRIORITIES = ("high", "normal", "low")
+# Lanes are visited in this weighted order so lower lanes still make progress
+# while higher ones are busy; each visit falls back to the other lanes in
+# priority order if its own lane is empty
+LANE_SCHEDULE = ("high", "high", "high", "high", "normal", "normal", "low")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# New jobs are rejected with a 503 once this many are waiting
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+# Job records (not the itineraries they produce) expire after JOB_TTL seconds
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# A dequeued job is leased to its worker for JOB_LEASE_SECONDS (covering the
+# generation deadline and the webhook); if the worker dies before
+# acknowledging it, the job goes back in its lane once the lease expires.
+# Expired leases are looked for at startup and every JOB_REQUEUE_INTERVAL.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", str(JOB_DEADLINE_SECONDS + 120)))
+JOB_REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", "60"))
+# Jobs that have been started this many times without finishing are failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+WEBHOOK_ATTEMPTS = int(os.getenv("WEBHOOK_ATTEMPTS", "3"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+# Comma-separated hosts callback_url may point at; when unset any host is
+# accepted whose addresses are all public (no loopback, private or link-local)
+WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
+
+class QueueFull(Exception):
+    """Raised when JOB_QUEUE_MAX jobs are already waiting."""
+
+class CallbackNotAllowed(ValueError):
+    """Raised for a callback_url that points at an internal or unlisted host."""
+
+async def check_callback_url(url):
+    """Raise CallbackNotAllowed unless url is an http(s) URL of an allowed, public host.
+
+    The host is resolved and every address checked, so names pointing at
+    internal services are refused too. Checked on submit and again before
+    each delivery, as DNS can change in between.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise CallbackNotAllowed("callback_url must be an http(s) URL")
+    if WEBHOOK_ALLOWED_HOSTS:
+        if host not in WEBHOOK_ALLOWED_HOSTS:
+            raise CallbackNotAllowed(f"callback host {host} is not allowed")
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port)
+    except (OSError, ValueError) as e:
+        raise CallbackNotAllowed(f"cannot resolve callback host {host}: {str(e)}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise CallbackNotAllowed(f"callback host {host} resolves to a non-public address")
+
+def new_job(destination, no_of_days, food_preference, user, priority="normal", callback_url=None):
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "destination": destination,
+        "no_of_days": no_of_days,
+        "food_preference": food_preference,
+        "user": user,
+        "priority": priority,
+        "callback_url": callback_url,
+        "itinerary_id": None,
+        "error": None,
+        "attempts": 0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+def lane_order(turn):
+    """Lanes to try, in order, for the given dequeue turn."""
+    preferred = LANE_SCHEDULE[turn % len(LANE_SCHEDULE)]
+    return [preferred] + [lane for lane in PRIORITIES if lane != preferred]
+
+class MemoryJobQueue:
+    """Per-process queue, used when Redis is not configured. Jobs are lost on restart."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lanes = {lane: OrderedDict() for lane in PRIORITIES}
+        self._queued = 0
+        # job_id -> lease expiry of dequeued jobs not yet acknowledged
+        self._processing = {}
+
+    def _push(self, job):
+        self._lanes[job["priority"]].setdefault(job["user"], deque()).append(job["job_id"])
+        self._queued += 1
+
+    async def enqueue(self, job):
+        if self._queued >= JOB_QUEUE_MAX:
+            raise QueueFull(f"{self._queued} jobs waiting")
+        self._jobs[job["job_id"]] = job
+        self._push(job)
+
+    async def dequeue(self, lanes):
+        job_id = self._pop(lanes)
+        if job_id is not None:
+            self._processing[job_id] = time.time() + JOB_LEASE_SECONDS
+        return job_id
+
+    async def ack(self, job_id):
+        self._processing.pop(job_id, None)
+
+    async def requeue_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, expiry in self._processing.items() if expiry <= now]
+        for job_id in expired:
+            del self._processing[job_id]
+            if job_id in self._jobs:
+                self._push(self._jobs[job_id])
+        return len(expired)
+
+    def _pop(self, lanes):
+        for lane in lanes:
+            users = self._lanes[lane]
+            if not users:
+                continue
+            # Oldest-served user first, then move them to the back of the line
+            user, queue = next(iter(users.items()))
+            job_id = queue.popleft()
+            if queue:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self._queued -= 1
+            return job_id
+        return None
+
+    async def save(self, job):
+        self._jobs[job["job_id"]] = job
+
+    async def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    async def queued(self):
+        return self._queued
+
+# Atomic enqueue: push the job onto its user's queue and put the user in the
+# lane's rotation if they weren't waiting already
+_ENQUEUE = """
+local queued = tonumber(redis.call('GET', KEYS[1]) or '0')
+if queued >= tonumber(ARGV[4]) then return 0 end
+redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[5])
+if redis.call('RPUSH', KEYS[3], ARGV[1]) == 1 then
+  redis.call('LPUSH', KEYS[4], ARGV[2])
+end
+redis.call('INCR', KEYS[1])
+return 1
+"""
+
+# Atomic dequeue: rotate through each lane's users (RPOPLPUSH moves the user
+# served to the other end of the list), pop the first job found and lease it
+# until ARGV[2]
+_DEQUEUE = """
+local prefix = ARGV[1]
+for i = 3, #ARGV do
+  local users = prefix .. ':lane:' .. ARGV[i] .. ':users'
+  for _ = 1, redis.call('LLEN', users) do
+    local user = redis.call('RPOPLPUSH', users, users)
+    local queue = prefix .. ':lane:' .. ARGV[i] .. ':user:' .. user
+    local job_id = redis.call('LPOP', queue)
+    if redis.call('LLEN', queue) == 0 then
+      redis.call('LREM', users, 0, user)
+    end
+    if job_id then
+      redis.call('DECR', prefix .. ':queued')
+      redis.call('ZADD', prefix .. ':processing', ARGV[2], job_id)
+      return job_id
+    end
+  end
+end
+return false
+"""
+
+# Atomic requeue of jobs whose lease expired before ARGV[2]: back onto their
+# user's queue in their lane, as in _ENQUEUE. Expired job records are dropped.
+_REQUEUE = """
+local prefix = ARGV[1]
+local expired = redis.call('ZRANGEBYSCORE', prefix .. ':processing', '-inf', ARGV[2])
+for _, job_id in ipairs(expired) do
+  redis.call('ZREM', prefix .. ':processing', job_id)
+  local value = redis.call('GET', prefix .. ':job:' .. job_id)
+  if value then
+    local job = cjson.decode(value)
+    local lane = prefix .. ':lane:' .. job.priority
+    if redis.call('RPUSH', lane .. ':user:' .. job.user, job_id) == 1 then
+      redis.call('LPUSH', lane .. ':users', job.user)
+    end
+    redis.call('INCR', prefix .. ':queued')
+  end
+end
+return #expired
+"""
+
+class RedisJobQueue:
+    """Queue shared by every worker process through Redis; survives restarts.
+
+    Dequeued jobs sit in the {prefix}:processing zset, scored by lease expiry,
+    until they are acknowledged.
+    """
+
+    def __init__(self, redis, prefix="jobs"):
+        self.redis = redis
+        self.prefix = prefix
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    async def enqueue(self, job):
+        lane = f"{self.prefix}:lane:{job['priority']}"
+        accepted = await self.redis.eval(
+            _ENQUEUE, 4,
+            f"{self.prefix}:queued", self._job_key(job["job_id"]), f"{lane}:user:{job['user']}", f"{lane}:users",
+            job["job_id"], job["user"], json.dumps(job), JOB_QUEUE_MAX, JOB_TTL,
+        )
+        if not accepted:
+            raise QueueFull(f"{JOB_QUEUE_MAX} jobs waiting")
+
+    async def dequeue(self, lanes):
+        return await self.redis.eval(_DEQUEUE, 0, self.prefix, time.time() + JOB_LEASE_SECONDS, *lanes)
+
+    async def ack(self, job_id):
+        await self.redis.zrem(f"{self.prefix}:processing", job_id)
+
+    async def requeue_expired(self):
+        return await self.redis.eval(_REQUEUE, 0, self.prefix, time.time())
+
+    async def save(self, job):
+        await self.redis.set(self._job_key(job["job_id"]), json.dumps(job), ex=JOB_TTL)
+
+    async def get(self, job_id):
+        value = await self.redis.get(self._job_key(job_id))
+        return json.loads(value) if value is not None else None
+
+    async def queued(self):
+        return int(await self.redis.get(f"{self.prefix}:queued") or 0)
+
+class JobWorkerPool:
+    """Runs queued jobs with a fixed number of workers.
+
+    generate(destination, no_of_days, food_preference) must return the id
+    of the stored itinerary, or None; it is injected so the pool shares the
+    API's single-flight, limiter and itinerary store.
+    """
+
+    def __init__(self, queue, generate, workers=JOB_WORKERS):
+        self.queue = queue
+        self.generate = generate
+        self.workers = workers
+        self._tasks = []
+        self._turn = 0
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._requeue_expired()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, job):
+        await self.queue.enqueue(job)
+        return job
+
+    async def _requeue_expired(self):
+        """Put jobs whose worker died before acknowledging them back in the queue."""
+        while True:
+            try:
+                requeued = await self.queue.requeue_expired()
+                if requeued:
+                    logger.warning(f"Requeued {requeued} jobs whose lease expired")
+            except Exception as e:
+                logger.error(f"Could not requeue expired jobs: {str(e)}")
+            await asyncio.sleep(JOB_REQUEUE_INTERVAL)
+
+    async def _work(self):
+        while True:
+            try:
+                self._turn += 1
+                job_id = await self.queue.dequeue(lane_order(self._turn))
+            except Exception as e:
+                logger.error(f"Could not read the job queue: {str(e)}")
+                job_id = None
+            if job_id is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            try:
+                job = await self.queue.get(job_id)
+                if job is None:
+                    logger.warning(f"Job {job_id} expired before it ran")
+                else:
+                    await self._run(job)
+                await self.queue.ack(job_id)
+            except Exception as e:
+                # Left leased: it is requeued when the lease expires
+                logger.error(f"Could not run job {job_id}: {str(e)}")
+
+    async def _run(self, job):
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            job.update(status="failed", error=f"Gave up after {JOB_MAX_ATTEMPTS} attempts", finished_at=time.time())
+            await self.queue.save(job)
+            if job["callback_url"]:
+                await notify(job)
+            return
+        job.update(status="running", started_at=time.time())
+        await self.queue.save(job)
+        try:
+            with request_deadline(JOB_DEADLINE_SECONDS):
+                itinerary_id = await self._generate(job)
+            if itinerary_id is None:
+                job.update(status="failed", error="Failed to generate itinerary")
+            else:
+                job.update(status="done", itinerary_id=itinerary_id)
+        except Exception as e:
+            logger.exception(f"Job {job['job_id']} failed: {str(e)}")
+            job.update(status="failed", error=str(e))
+        job["finished_at"] = time.time()
+        await self.queue.save(job)
+        if job["callback_url"]:
+            await notify(job)
+
+    async def _generate(self, job):
+        attempt = 0
+        while True:
+            try:
+                return await self.generate(job["destination"], job["no_of_days"], job["food_preference"])
+            except GenerationSaturated:
+                # The API is using every generation slot; wait our turn rather than
+                # fail, but not past the job deadline (and so the job's lease)
+                attempt += 1
+                delay = backoff_delay(attempt) + JOB_POLL_INTERVAL
+                remaining = remaining_time()
+                if remaining is not None and remaining <= delay:
+                    raise
+                await asyncio.sleep(delay)
+
+async def notify(job):
+    """POST the finished job to its callback_url, retrying with backoff."""
+    payload = {key: job[key] for key in ("job_id", "status", "itinerary_id", "error")}
+    for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+        try:
+            await check_callback_url(job["callback_url"])
+        except CallbackNotAllowed as e:
+            logger.error(f"Not calling webhook for job {job['job_id']}: {str(e)}")
+            return
+        try:
+            response = await get_http_client().post(job["callback_url"], json=payload, timeout=WEBHOOK_TIMEOUT)
+            response.raise_for_status()
+            return
+        except Exception as e:
+            logger.warning(f"Webhook for job {job['job_id']} failed (attempt {attempt}): {str(e)}")
+            if attempt < WEBHOOK_ATTEMPTS:
+                await asyncio.sleep(backoff_delay(attempt))
+    logger.error(f"Giving up on webhook for job {job['job_id']}")
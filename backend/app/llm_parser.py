@@ -0,0 +1,223 @@
+import json
+import logging
+import re
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Everything the scanner cares about in one pass: strings (so braces inside
+# them are ignored), // and /* */ comments, and structural characters
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|//[^\n]*|/\*.*?(?:\*/|$)|[{}\[\],:]', re.DOTALL)
+
+
+def _clean_json(text, start=0):
+    """Return the balanced value opening at text[start] with comments and trailing commas removed.
+
+    If the text ends before the value closes (a truncated response)
+    everything up to the end is returned.
+    """
+    return _scan_json(text, start)[0]
+
+def _scan_json(text, start):
+    """Return (cleaned, end) for the value opening at text[start]; see _clean_json."""
+    pieces = []
+    position = start
+    depth = 0
+    pending_comma = None
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        if pending_comma is not None:
+            # A comma only survives if something other than a closer follows it
+            if token not in ("]", "}") and token[:2] not in ("//", "/*"):
+                pieces.append(",")
+                pending_comma = None
+            elif token in ("]", "}"):
+                pending_comma = None
+        pieces.append(text[position:match.start()])
+        position = match.end()
+        if token[:2] in ("//", "/*"):
+            continue
+        if token == ",":
+            pending_comma = match
+            continue
+        pieces.append(token)
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            depth -= 1
+            if depth == 0:
+                return "".join(pieces), position
+    pieces.append(text[position:])
+    return "".join(pieces), len(text)
+
+def _split_entries(text):
+    """Yield (key, value_text) for each top-level entry of a cleaned object."""
+    depth = 0
+    key = None
+    value_start = None
+    expecting_key = False
+    for match in _TOKEN.finditer(text):
+        token = match.group()
+        if token in "{[":
+            depth += 1
+            if depth == 1:
+                expecting_key = True
+        elif token in "}]":
+            if depth == 1 and key is not None and value_start is not None:
+                yield key, text[value_start:match.start()]
+                key = value_start = None
+            depth -= 1
+        elif depth != 1:
+            continue
+        elif token.startswith('"') and expecting_key:
+            try:
+                key = json.loads(token)
+            except json.JSONDecodeError:
+                key = token[1:-1]
+            expecting_key = False
+        elif token == ":" and key is not None and value_start is None:
+            value_start = match.end()
+        elif token == ",":
+            if key is not None and value_start is not None:
+                yield key, text[value_start:match.start()]
+            key = value_start = None
+            expecting_key = True
+    if key is not None and value_start is not None:
+        # Truncated output: hand back what there is so the key is reported as failed
+        yield key, text[value_start:]
+
+def _fence_body(text):
+    """The body of the first ```json (or bare ```) fence, or None; an unclosed fence runs to the end."""
+    # str.find rather than a regex: a lazy DOTALL scan for the closing fence
+    # costs more than parsing a clean response
+    start = text.find("```")
+    if start == -1:
+        return None
+    newline = text.find("\n", start)
+    if newline == -1 or text[start + 3:newline].strip().lower() not in ("", "json"):
+        return None
+    end = text.find("```", newline)
+    return text[newline + 1:] if end == -1 else text[newline + 1:end]
+
+def _parse_object(cleaned):
+    """Return (data, failed) for a cleaned object; see parse_llm_json."""
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            return data, []
+    except json.JSONDecodeError:
+        pass
+
+    data = {}
+    failed = []
+    for key, value_text in _split_entries(cleaned):
+        try:
+            data[key] = json.loads(value_text)
+        except json.JSONDecodeError:
+            failed.append(key)
+    return data, failed
+
+def parse_llm_json(text):
+    """Parse the JSON object in an LLM response, recovering what it can.
+
+    The body of a ```json fence is preferred; otherwise each {...} in the
+    text is tried in turn, so prose such as "{id}" before the object is
+    skipped. // and /* */ comments and trailing commas are ignored. If the
+    object as a whole still does not parse, each top-level entry is parsed on
+    its own. Returns (data, failed): data maps each key that parsed to its
+    value (None if nothing in the text parses as an object), failed lists the
+    keys whose values did not.
+    """
+    fence = _fence_body(text)
+    if fence is not None and "{" in fence:
+        text = fence
+    start = text.find("{")
+    if start == -1:
+        return None, []
+    # Fast path: most responses are clean JSON inside a fence, and json.loads
+    # (in C) is far cheaper than the tokenizing scan below
+    try:
+        data = json.loads(text[start:text.rfind("}") + 1])
+        if isinstance(data, dict):
+            return data, []
+    except json.JSONDecodeError:
+        pass
+
+    # The first object with entries whose values did not parse, in case no
+    # later one parses either
+    partial = None
+    while start != -1:
+        cleaned, end = _scan_json(text, start)
+        data, failed = _parse_object(cleaned)
+        if data:
+            return data, failed
+        if failed and partial is None:
+            partial = data, failed
+        # Objects nested in this one are its values, not candidates
+        start = text.find("{", end)
+    return partial or (None, [])
+
+class IncrementalDayParser:
+    """Pull complete top-level entries out of a JSON object as it streams in.
+
+    Feed text chunks as they arrive; feed() returns the (key, value) pairs of
+    the top-level object whose values have been closed since the last call.
+    Text before the opening brace (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._value_start = None
+        self._position = 0
+        self.failed = []
+
+    def feed(self, text: str):
+        completed = []
+        for char in text:
+            self._buffer.append(char)
+            index = self._position
+            self._position += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._last_key = "".join(self._buffer[self._string_start + 1:index])
+                continue
+
+            if char == '"' and self._depth >= 1:
+                self._in_string = True
+                self._string_start = index
+            elif char in "[{":
+                self._depth += 1
+                if self._depth == 2:
+                    self._value_start = index
+            elif char in "]}":
+                if self._depth == 2 and self._value_start is not None:
+                    entry = self._decode("".join(self._buffer[self._value_start:index + 1]))
+                    if entry is not None:
+                        completed.append(entry)
+                    self._value_start = None
+                self._depth = max(self._depth - 1, 0)
+        return completed
+
+    def _decode(self, text):
+        try:
+            try:
+                return self._last_key, json.loads(text)
+            except json.JSONDecodeError:
+                return self._last_key, json.loads(_clean_json(text))
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not parse streamed entry {self._last_key}: {e}")
+            self.failed.append(self._last_key)
+            metrics.record_parse_failure("stream_day")
+            return None
@@ -1,41 +1,43 @@
+import asyncio
+import ipaddress
 import os
-from fastapi import FastAPI, Depends, HTTPException, Query
+import time
+from dotenv import load_dotenv
+
+# Load .env before the app modules read their configuration
+load_dotenv()
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud, models, schemas, database, itinerary_generator
-from .database import SessionLocal, engine
-from dotenv import load_dotenv
+from .database import AsyncSessionLocal, async_engine
+from .http_client import close_http_client
+from . import cache as app_cache
+from . import catalog
+from . import clients
+from . import itinerary_model
+from . import itinerary_store
+from . import jobs
+from . import passwords
+from . import warmup
+from .concurrency import GenerationSaturated, generation_limiter
+from .itinerary_service import generate_itinerary_once
+from .resilience import request_deadline, upstream_states
+from . import metrics
 import logging
-from fastapi.responses import JSONResponse
-from pydantic import constr, conint,BaseModel, RootModel, Field
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
+import orjson
+from pydantic import constr, conint
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from fastapi_cache.decorator import cache
 import aioredis
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
-import tenacity
-from tenacity import retry, stop_after_attempt, wait_fixed
 from typing import List, Optional, Dict
 
-print("Starting application...")  # Debug print
-
-load_dotenv()
-
-print(f"GOOGLE_MAPS_API_KEY: {os.getenv('GOOGLE_MAPS_API_KEY')}")  # Debug print
-print(f"Current working directory: {os.getcwd()}")  # Debug print
-print(f"Files in current directory: {os.listdir()}")  # Debug print
-
-try:
-    # Use absolute imports
-    from app import crud, models, schemas, database, itinerary_generator
-    print("Imports successful")  # Debug print
-except ImportError as e:
-    print(f"Import error: {e}")  # Debug print
-    raise
-
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
 
 # Configure CORS
@@ -47,61 +49,179 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace_id = metrics.new_trace_id(request.headers.get("X-Request-ID"))
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so path parameters don't explode cardinality
+    route = request.scope.get("route")
+    metrics.record_request(getattr(route, "path", "unmatched"), response.status_code, time.perf_counter() - start)
+    response.headers["X-Request-ID"] = trace_id
+    return response
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+@app.exception_handler(GenerationSaturated)
+async def generation_saturated_handler(request, exc: GenerationSaturated):
+    logger.warning(f"Rejecting itinerary generation: {str(exc)}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Itinerary generation is at capacity, please retry shortly"},
+        headers={"Retry-After": "5"},
+    )
+
+class JSONBytesResponse(JSONResponse):
+    """JSON response for content that is already serialized; anything else goes through orjson."""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            # FastAPI's jsonable_encoder turns returned bytes into str on the way here
+            return content.encode("utf-8")
+        return orjson.dumps(content)
+
+# Upper bound on the time one request may spend on upstream calls
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# Load balancers and proxies in front of the app (comma-separated addresses or
+# CIDRs). Requests from them are attributed to the client they append to
+# X-Forwarded-For; entries a client sent itself are never trusted.
+TRUSTED_PROXIES = [ipaddress.ip_network(proxy.strip()) for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+
+def _trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_address(request: Request):
+    """The calling client's address, looking through TRUSTED_PROXIES."""
+    address = request.client.host
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    # Walk back from the nearest hop while it is one of our proxies
+    while hops and _trusted_proxy(address):
+        address = hops.pop()
+    return address
+
+async def generate_itinerary_job(destination: str, no_of_days: int, food_preference: str):
+    """Job worker entry point: returns the id of the stored itinerary, or None."""
+    itinerary_id, _ = await generate_itinerary_once(destination, no_of_days, food_preference)
+    return itinerary_id
+
+async def create_job_queue(redis):
+    """Redis-backed job queue, or an in-process one if Redis is disabled or unreachable."""
+    if os.getenv("JOB_QUEUE_BACKEND", "redis") == "redis":
+        try:
+            await redis.ping()
+            return jobs.RedisJobQueue(redis)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for the job queue, using an in-memory queue: {str(e)}")
+    return jobs.MemoryJobQueue()
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=db, user=user)
+
+@app.post("/login/", response_model=schemas.User)
+async def login(
+    user: schemas.UserLogin,
+    db: AsyncSession = Depends(get_db),
+    # Each attempt costs a bcrypt verification; also slows password guessing
+    rate_limiter: RateLimiter = Depends(RateLimiter(times=10, seconds=60))
+):
+    db_user = await crud.authenticate_user(db, email=user.email, password=user.password)
+    if db_user is None:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    return db_user
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
-class Activity(BaseModel):
-    time: str
-    activity: str
-    place_name: str
-    description: str
-    rating: Optional[float]
-    review: str
-    google_maps_url: str
-    website_url: Optional[str]
-    estimated_travel_time: str
-    location: Dict[str, float]
-    distance_to_next: Optional[str]
-
-class DayItinerary(BaseModel):
-    activities: List[Activity]
-
-class FullItinerary(BaseModel):
-    itinerary: Dict[str, DayItinerary]
-
 @app.on_event("startup")
 async def startup():
-    redis = aioredis.from_url("redis://redis", encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    metrics.configure_logging()
+    if not itinerary_generator.GOOGLE_MAPS_API_KEY:
+        raise ValueError("GOOGLE_MAPS_API_KEY is not set in the environment variables")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await conn.run_sync(itinerary_store.upgrade_schema)
+        await conn.run_sync(catalog.upgrade_schema)
+    redis = aioredis.from_url(os.getenv("REDIS_URL", "redis://redis"), encoding="utf8", decode_responses=True)
+    FastAPICache.init(RedisBackend(redis), prefix=app_cache.RESPONSE_CACHE_PREFIX)
+    app_cache.set_redis(redis)
     await FastAPILimiter.init(redis)
+    app.state.job_pool = jobs.JobWorkerPool(await create_job_queue(redis), generate_itinerary_job)
+    app.state.job_pool.start()
+    app.state.catalog_refresher = asyncio.create_task(itinerary_generator.run_place_catalog_refresher())
+    app.state.warmup = None
+    if warmup.WARMUP_ENABLED:
+        app.state.warmup = asyncio.create_task(warmup.run_warmup_scheduler(generation_limiter))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.catalog_refresher.cancel()
+    if app.state.warmup is not None:
+        app.state.warmup.cancel()
+    await app.state.job_pool.stop()
+    passwords.shutdown_pool()
+    await close_http_client()
+    await async_engine.dispose()
 
-@app.get("/generate_itinerary/", response_model=FullItinerary)
-@app.post("/generate_itinerary/", response_model=FullItinerary)
-@cache(expire=3600)
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+@app.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/health/upstreams")
+async def upstream_health():
+    """Circuit breaker, retry budget and call counters for each upstream."""
+    return upstream_states()
+
+@app.get("/health/cache")
+async def cache_health():
+    """Hit ratio of the /generate_itinerary/ response cache in this process."""
+    return {
+        "itinerary_response": {**app_cache.CompressedJsonCoder.stats, "hit_ratio": app_cache.CompressedJsonCoder.hit_ratio()},
+    }
+
+# The route returns JSON bytes built by itinerary_model (and cache hits are
+# the stored bytes), so FastAPI doesn't validate the response again;
+# schemas.FullItinerary still documents it
+GENERATE_ITINERARY_ROUTE = dict(
+    response_model=None,
+    response_class=JSONBytesResponse,
+    responses={200: {"model": schemas.FullItinerary}},
+    # Popularity is counted in a dependency so that cache hits are counted too;
+    # rate limited and failed requests are not (see warmup.count_trip_request)
+    dependencies=[Depends(warmup.count_trip_request)],
+)
+
+@app.get("/generate_itinerary/", **GENERATE_ITINERARY_ROUTE)
+@app.post("/generate_itinerary/", **GENERATE_ITINERARY_ROUTE)
+@cache(
+    expire=app_cache.RESPONSE_CACHE_TTL,
+    namespace=app_cache.RESPONSE_CACHE_NAMESPACE,
+    coder=app_cache.CompressedJsonCoder,
+    key_builder=app_cache.itinerary_cache_key,
+)
 async def generate_itinerary(
     destination: constr(min_length=1, max_length=100) = Query(..., description="Destination city"),
     no_of_days: conint(ge=1, le=14) = Query(..., description="Number of days for the trip"),
@@ -110,44 +230,156 @@ async def generate_itinerary(
 ):
     try:
         logger.info(f"Generating itinerary for {destination}, {no_of_days} days, {food_preference}")
-        itinerary_data = itinerary_generator.generate_itinerary(
-            destination=destination,
-            no_of_days=no_of_days,
-            food_preference=food_preference
-        )
+        with request_deadline(REQUEST_DEADLINE_SECONDS):
+            _, itinerary_data = await generate_itinerary_once(destination, no_of_days, food_preference)
         logger.debug(f"Generated itinerary: {itinerary_data}")
         if itinerary_data is None:
             logger.error("Generated itinerary is None")
             raise HTTPException(status_code=500, detail="Failed to generate itinerary: Itinerary data is None")
-        # Restructure the data to match the FullItinerary model
-        structured_itinerary = {
-            day: DayItinerary(activities=activities)
-            for day, activities in itinerary_data.items()
-        }
-        return FullItinerary(itinerary=structured_itinerary)
+        # Repairs field-level defects in the generated data on the way
+        return itinerary_model.Itinerary.from_days(itinerary_data).dumps()
+    except GenerationSaturated:
+        raise
     except Exception as e:
         logger.exception(f"Error generating itinerary: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate itinerary: {str(e)}")
 
+@app.get("/generate_itinerary/stream")
+async def stream_itinerary(
+    destination: constr(min_length=1, max_length=100) = Query(..., description="Destination city"),
+    no_of_days: conint(ge=1, le=14) = Query(..., description="Number of days for the trip"),
+    food_preference: constr(min_length=1, max_length=100) = Query(..., description="Food preference"),
+    rate_limiter: RateLimiter = Depends(RateLimiter(times=10, seconds=60))
+):
+    """Stream the itinerary as NDJSON, one line per day as soon as it is ready.
+
+    Each line is {"day": ..., "activities": [...]}; the stream ends with
+    {"done": true} or {"error": ...}. Days only arrive one by one with
+    ITINERARY_PLANNER=llm; the local planner (the default) and stored trips
+    have every day at once, and they all follow together.
+    """
+    # Turn requests away with a 503 before the stream starts where possible
+    if generation_limiter.saturated:
+        raise GenerationSaturated("no generation slots available")
+
+    # Days generated by this request as Gemini streams them out, and their order
+    streamed_days = {}
+    ready = asyncio.Queue()
+
+    async def generate_streamed(destination, no_of_days, food_preference):
+        async for day, activities in itinerary_generator.stream_itinerary(destination, no_of_days, food_preference):
+            streamed_days[day] = activities
+            ready.put_nowait(day)
+        # Regenerated days stream last; keep the stored itinerary in day order
+        days = [f"Day {day}" for day in range(1, no_of_days + 1)]
+        return {day: streamed_days[day] for day in days if day in streamed_days}
+
+    def day_line(itinerary_data, day):
+        day_itinerary = itinerary_model.Itinerary.from_days({day: itinerary_data[day]})
+        return orjson.dumps({"day": day, **day_itinerary.day_response(day)}) + b"\n"
+
+    async def lines():
+        # Same store, single-flight and planner as /generate_itinerary/; only an
+        # LLM-planned trip generated by this request streams day by day,
+        # otherwise the days follow once the itinerary is ready
+        streamed = itinerary_generator.ITINERARY_PLANNER == "llm"
+        generation = None
+        sent = set()
+        try:
+            with request_deadline(REQUEST_DEADLINE_SECONDS):
+                generation = asyncio.create_task(generate_itinerary_once(
+                    destination, no_of_days, food_preference, generate=generate_streamed if streamed else None
+                ))
+                while not generation.done():
+                    next_day = asyncio.create_task(ready.get())
+                    await asyncio.wait({generation, next_day}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_day.done():
+                        next_day.cancel()
+                        continue
+                    day = next_day.result()
+                    sent.add(day)
+                    yield day_line(streamed_days, day)
+                _, itinerary_data = generation.result()
+            if itinerary_data is None:
+                raise ValueError("Itinerary data is None")
+            for day in itinerary_data:
+                if day not in sent:
+                    yield day_line(itinerary_data, day)
+            yield json.dumps({"done": True}) + "\n"
+        except GenerationSaturated:
+            yield json.dumps({"error": "Itinerary generation is at capacity, please retry shortly"}) + "\n"
+        except Exception as e:
+            logger.exception(f"Error streaming itinerary: {str(e)}")
+            yield json.dumps({"error": f"Failed to generate itinerary: {str(e)}"}) + "\n"
+        finally:
+            if generation is not None:
+                generation.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/jobs/itinerary", response_model=schemas.Job, status_code=202)
+async def submit_itinerary_job(
+    request: Request,
+    destination: constr(min_length=1, max_length=100) = Query(..., description="Destination city"),
+    no_of_days: conint(ge=1, le=14) = Query(..., description="Number of days for the trip"),
+    food_preference: constr(min_length=1, max_length=100) = Query(..., description="Food preference"),
+    # "high" is kept for jobs the service submits itself
+    priority: constr(pattern="^(normal|low)$") = Query("normal", description="Queue lane"),
+    callback_url: Optional[constr(pattern="^https?://", max_length=2000)] = Query(None, description="POSTed to when the job finishes"),
+    rate_limiter: RateLimiter = Depends(RateLimiter(times=10, seconds=60))
+):
+    """Queue an itinerary for background generation; poll /jobs/{job_id} or wait for the callback."""
+    if callback_url is not None:
+        try:
+            await jobs.check_callback_url(callback_url)
+        except jobs.CallbackNotAllowed as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    job = jobs.new_job(
+        destination, no_of_days, food_preference,
+        # Jobs are shared fairly between clients; the caller doesn't get to say who they are
+        user=client_address(request),
+        priority=priority,
+        callback_url=callback_url,
+    )
+    try:
+        await app.state.job_pool.submit(job)
+    except jobs.QueueFull as e:
+        raise GenerationSaturated(str(e))
+    return job
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def read_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await app.state.job_pool.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "done":
+        db_itinerary = await crud.get_itinerary(db, itinerary_id=job["itinerary_id"])
+        if db_itinerary is not None:
+            # The stored trip may be a longer one this job's trip was served from
+            days = itinerary_store.first_days(db_itinerary.days, job["no_of_days"]) or db_itinerary.days
+            job["itinerary"] = {
+                "itinerary": {day: {"activities": activities} for day, activities in days.items()}
+            }
+    return job
+
 @app.post("/itineraries/", response_model=schemas.Itinerary)
-def create_itinerary(itinerary: schemas.ItineraryCreate, user_id: int, db: Session = Depends(get_db)):
-    return crud.create_itinerary(db=db, itinerary=itinerary, user_id=user_id)
+async def create_itinerary(itinerary: schemas.ItineraryCreate, user_id: int, db: AsyncSession = Depends(get_db)):
+    return await crud.create_itinerary(db=db, itinerary=itinerary, user_id=user_id)
 
 @app.get("/itineraries/{itinerary_id}", response_model=schemas.Itinerary)
-def read_itinerary(itinerary_id: int, db: Session = Depends(get_db)):
-    db_itinerary = crud.get_itinerary(db, itinerary_id=itinerary_id)
+async def read_itinerary(itinerary_id: int, db: AsyncSession = Depends(get_db)):
+    db_itinerary = await crud.get_itinerary(db, itinerary_id=itinerary_id)
     if db_itinerary is None:
         raise HTTPException(status_code=404, detail="Itinerary not found")
     return db_itinerary
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 @app.get("/test_itinerary/")
 async def test_itinerary():
     logger.debug("Accessing test_itinerary endpoint")
     try:
-        itinerary_data = itinerary_generator.generate_itinerary(
+        itinerary_data = await itinerary_generator.generate_itinerary(
             destination="Paris",
             no_of_days=3,
             food_preference="French cuisine"
@@ -161,12 +393,10 @@ async def test_itinerary():
         logger.error(f"Error generating itinerary: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-print("Application initialized")  # Debug print
-
 @app.get("/test_google_maps/")
 async def test_google_maps():
     try:
-        result = itinerary_generator.get_places("Tokyo", "tourist attraction")
+        result = await itinerary_generator.get_places("Tokyo", "tourist attraction")
         return {"result": result}
     except Exception as e:
         logger.exception(f"Error testing Google Maps API: {str(e)}")
@@ -175,8 +405,8 @@ async def test_google_maps():
 @app.get("/test_gemini/")
 async def test_gemini():
     try:
-        model = itinerary_generator.GenerativeModel('gemini-1.5-pro-002')
-        response = model.generate_content("Generate a short itinerary for Tokyo")
+        model = clients.generative_model()
+        response = await model.generate_content_async("Generate a short itinerary for Tokyo")
         return {"result": response.text}
     except Exception as e:
         logger.exception(f"Error testing Gemini model: {str(e)}")
@@ -187,7 +417,7 @@ async def test_ors():
     try:
         origin = {"lat": 35.6895, "lng": 139.6917}  # Tokyo coordinates
         destination = {"lat": 35.6762, "lng": 139.6503}  # Shinjuku coordinates
-        distance = itinerary_generator.calculate_distance(origin, destination)
+        distance = await itinerary_generator.calculate_distance(origin, destination)
         return {"distance": distance}
     except Exception as e:
         logger.exception(f"Error testing ORS API: {str(e)}")
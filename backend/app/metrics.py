@@ -0,0 +1,115 @@
+import contextvars
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# With metrics disabled every helper below returns immediately
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+STAGE_SECONDS = Histogram(
+    "itinerary_stage_seconds", "Time spent in each itinerary pipeline stage", ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40),
+)
+REQUEST_SECONDS = Histogram("http_request_seconds", "HTTP request latency", ["route", "status"])
+STAGE_ERRORS = Counter("itinerary_stage_errors_total", "Pipeline stages that raised", ["stage"])
+UPSTREAM_CALLS = Counter("upstream_calls_total", "Upstream call attempts", ["upstream", "outcome"])
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Upstream retries", ["upstream"])
+UPSTREAM_SECONDS = Histogram("upstream_call_seconds", "Latency of upstream call attempts", ["upstream"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by outcome", ["cache", "result"])
+LLM_TOKENS = Histogram(
+    "llm_tokens", "Gemini prompt and response token counts", ["kind"],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+PARSE_FAILURES = Counter("llm_parse_failures_total", "LLM outputs that could not be parsed", ["parser"])
+
+logger = logging.getLogger(__name__)
+
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+def new_trace_id(trace_id=None):
+    """Start a trace for the current request; returns the trace ID in use."""
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+def current_trace_id():
+    return _trace_id.get()
+
+_default_record_factory = logging.getLogRecordFactory()
+
+def _record_factory(*args, **kwargs):
+    # Every log record carries the trace ID of the request that produced it
+    record = _default_record_factory(*args, **kwargs)
+    record.trace_id = _trace_id.get()
+    return record
+
+logging.setLogRecordFactory(_record_factory)
+
+def configure_logging():
+    """Set up root logging with trace IDs; called once from app startup rather than at import."""
+    logging.basicConfig(level=LOG_LEVEL, format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s")
+
+_NULL_STAGE = nullcontext()
+
+@contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        logger.debug(f"stage {name} took {elapsed * 1000:.1f} ms")
+
+def stage(name):
+    """Context manager timing one pipeline stage into itinerary_stage_seconds."""
+    return _timed_stage(name) if METRICS_ENABLED else _NULL_STAGE
+
+def record_request(route, status, seconds):
+    if METRICS_ENABLED:
+        REQUEST_SECONDS.labels(route, str(status)).observe(seconds)
+
+def record_upstream_call(upstream, outcome, seconds):
+    if METRICS_ENABLED:
+        UPSTREAM_CALLS.labels(upstream, outcome).inc()
+        UPSTREAM_SECONDS.labels(upstream).observe(seconds)
+
+def record_upstream_retry(upstream):
+    if METRICS_ENABLED:
+        UPSTREAM_RETRIES.labels(upstream).inc()
+
+def record_cache_lookup(cache, result, count=1):
+    if METRICS_ENABLED and count:
+        CACHE_LOOKUPS.labels(cache, result).inc(count)
+
+def record_llm_usage(response):
+    """Record prompt/response token counts from a Gemini response, if it has them."""
+    if not METRICS_ENABLED:
+        return
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    if getattr(usage, "prompt_token_count", None):
+        LLM_TOKENS.labels("prompt").observe(usage.prompt_token_count)
+    if getattr(usage, "candidates_token_count", None):
+        LLM_TOKENS.labels("response").observe(usage.candidates_token_count)
+
+def record_prompt_tokens(tokens):
+    """Record the estimated size of a prompt before it is sent."""
+    if METRICS_ENABLED:
+        LLM_TOKENS.labels("prompt_estimate").observe(tokens)
+
+def record_parse_failure(parser, count=1):
+    if METRICS_ENABLED and count:
+        PARSE_FAILURES.labels(parser).inc(count)
+
+def render():
+    """Return (body, content_type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
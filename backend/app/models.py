@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -9,13 +9,52 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
 
+    itineraries = relationship("Itinerary", back_populates="owner")
+
 class Itinerary(Base):
     __tablename__ = "itineraries"
 
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     days = Column(JSON)
+    # Set for itineraries stored by the generator (see itinerary_store.py);
+    # content_hash covers the normalized request and the generator version
+    content_hash = Column(String(64))
+    destination_key = Column(String)
+    food_key = Column(String)
+    no_of_days = Column(Integer)
+    generator_version = Column(String)
+    created_at = Column(DateTime)
 
     owner = relationship("User", back_populates="itineraries")
 
+    __table_args__ = (
+        Index("ix_itineraries_content_hash", "content_hash", unique=True),
+        Index("ix_itineraries_trip", "destination_key", "food_key", "generator_version", "no_of_days"),
+    )
+
+class CatalogPlace(Base):
+    __tablename__ = "catalog_places"
+
+    id = Column(Integer, primary_key=True, index=True)
+    destination_key = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    category = Column(String, nullable=False)
+    cuisine = Column(String, nullable=False, default="")
+    position = Column(Integer, nullable=False)
+    place_id = Column(String, nullable=False)
+    name = Column(String)
+    rating = Column(Float)
+    lat = Column(Float)
+    lng = Column(Float)
+    data = Column(JSON)
+    refreshed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_catalog_places_lookup", "destination_key", "category", "cuisine"),
+        # Concurrent refreshes of a destination upsert rather than duplicate places
+        Index("ix_catalog_places_place", "destination_key", "category", "cuisine", "place_id", unique=True),
+        Index("ix_catalog_places_refreshed_at", "refreshed_at"),
+    )
+
 # Remove the Activity model as we're now storing activities within the Itinerary JSON
@@ -0,0 +1,100 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import os
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor for new hashes. Stored hashes with a different cost are
+# rehashed on the user's next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes that hash and verify passwords, so a burst of signups or logins
+# neither blocks the event loop nor ties up the thread pool other routes use.
+# 0 hashes on the default thread pool instead.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# bcrypt only looks at the first 72 bytes of a password
+MAX_PASSWORD_BYTES = 72
+
+_executor = None
+_workers = PASSWORD_HASH_WORKERS
+# Hash checked against for unknown emails, so they take as long as known ones
+_dummy_hash = None
+
+def _secret(password):
+    return password.encode("utf-8")[:MAX_PASSWORD_BYTES]
+
+def hash_password_sync(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode("ascii")
+
+def needs_rehash(hashed, rounds=BCRYPT_ROUNDS):
+    """True if hashed was made with another scheme variant or cost than new hashes."""
+    try:
+        return not hashed.startswith("$2b$") or int(hashed.split("$")[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+def verify_and_update_sync(password, hashed, rounds=BCRYPT_ROUNDS):
+    """Return (valid, new_hash); new_hash is set when a valid hash should be replaced."""
+    try:
+        valid = bcrypt.checkpw(_secret(password), hashed.encode("ascii"))
+    except ValueError:
+        # Not a bcrypt hash
+        return False, None
+    if valid and needs_rehash(hashed, rounds):
+        return True, hash_password_sync(password, rounds)
+    return valid, None
+
+def start_pool(workers=PASSWORD_HASH_WORKERS):
+    """Resize the hashing pool; its processes start on first use. 0 uses threads."""
+    global _workers
+    shutdown_pool()
+    _workers = workers
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # Spawned, not forked: the parent has an event loop, DB pools and threads
+        _executor = ProcessPoolExecutor(_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+async def _run(fn, *args):
+    global _executor
+    if _workers <= 0:
+        return await asyncio.to_thread(fn, *args)
+    executor = _pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        # A worker process died (e.g. OOM-killed), which breaks the whole pool.
+        # Replace it, unless a concurrent call already has, and retry once.
+        if _executor is executor:
+            logger.warning("Password hashing pool broke, starting a new one")
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        return await asyncio.get_running_loop().run_in_executor(_pool(), fn, *args)
+
+async def hash_password(password):
+    # The cost is read per call and passed along, so worker processes never
+    # need their own configuration
+    return await _run(hash_password_sync, password, BCRYPT_ROUNDS)
+
+async def verify_password(password, hashed):
+    """Return (valid, new_hash); see verify_and_update_sync."""
+    return await _run(verify_and_update_sync, password, hashed, BCRYPT_ROUNDS)
+
+async def verify_unknown_user(password):
+    """Do the work of a failed login for an email that doesn't exist."""
+    global _dummy_hash
+    if _dummy_hash is None or needs_rehash(_dummy_hash):
+        _dummy_hash = await hash_password("not a real password")
+    await verify_password(password, _dummy_hash)
+    return False
@@ -0,0 +1,229 @@
+import math
+from .geo import ROAD_FACTOR, haversine_km, haversine_matrix
+
+def _point(place):
+    location = place.get('location') or {}
+    return (location.get('lat'), location.get('lng'))
+
+def _has_location(place):
+    lat, lng = _point(place)
+    return lat is not None and lng is not None
+
+def _projected(points):
+    # Equirectangular projection so lat/lng distances are comparable
+    mean_lat = sum(lat for lat, _ in points) / len(points)
+    scale = math.cos(math.radians(mean_lat))
+    return [(lat, lng * scale) for lat, lng in points]
+
+def _squared_distance(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2
+
+def kmeans(points, k, iterations=25):
+    """Deterministic k-means over (lat, lng) points; returns a cluster index per point.
+
+    Centroids are seeded by farthest-point traversal from the first point, so
+    the same input always gives the same clusters.
+    """
+    if not points:
+        return []
+    k = max(1, min(k, len(points)))
+    projected = _projected(points)
+
+    centroids = [projected[0]]
+    while len(centroids) < k:
+        farthest = max(projected, key=lambda p: min(_squared_distance(p, c) for c in centroids))
+        centroids.append(farthest)
+
+    labels = [0] * len(projected)
+    for iteration in range(iterations):
+        new_labels = [
+            min(range(k), key=lambda c: _squared_distance(point, centroids[c]))
+            for point in projected
+        ]
+        if iteration > 0 and new_labels == labels:
+            break
+        labels = new_labels
+        for c in range(k):
+            members = [point for point, label in zip(projected, labels) if label == c]
+            if members:
+                centroids[c] = (
+                    sum(p[0] for p in members) / len(members),
+                    sum(p[1] for p in members) / len(members),
+                )
+    return labels
+
+def assign_places_to_days(places, no_of_days):
+    """Split places into no_of_days geographic groups, one list per day.
+
+    Places are clustered by location and clusters are handed out largest
+    first. With fewer clusters than days the clusters are reused in order.
+    Places without a location are spread round-robin.
+    """
+    located = [place for place in places if _has_location(place)]
+    unlocated = [place for place in places if not _has_location(place)]
+    days = [[] for _ in range(no_of_days)]
+    if located:
+        labels = kmeans([_point(place) for place in located], no_of_days)
+        clusters = {}
+        for place, label in zip(located, labels):
+            clusters.setdefault(label, []).append(place)
+        ordered = sorted(clusters.values(), key=len, reverse=True)
+        for day in range(no_of_days):
+            days[day] = list(ordered[day % len(ordered)])
+    for i, place in enumerate(unlocated):
+        days[i % no_of_days].append(place)
+    return days
+
+AVERAGE_SPEED_KMH = 30.0
+
+DAY_START_MINUTES = 8 * 60
+MEAL_MINUTES = 60
+ATTRACTION_MINUTES = 120
+DINNER_NOT_BEFORE = 19 * 60
+CHECK_IN_NOT_BEFORE = 21 * 60
+
+def distance_matrix(points):
+    return haversine_matrix(points).tolist()
+
+def _path_length(path, matrix):
+    return sum(matrix[path[i]][path[i + 1]] for i in range(len(path) - 1))
+
+def order_stops(matrix, start=0):
+    """Order every index of matrix into a short open path beginning at start.
+
+    Builds a nearest-neighbour tour and improves it with 2-opt until no
+    reversal shortens it. The start index stays first.
+    """
+    remaining = set(range(len(matrix))) - {start}
+    path = [start]
+    while remaining:
+        nearest = min(remaining, key=lambda i: (matrix[path[-1]][i], i))
+        path.append(nearest)
+        remaining.remove(nearest)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                candidate = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                if _path_length(candidate, matrix) < _path_length(path, matrix) - 1e-9:
+                    path = candidate
+                    improved = True
+    return path
+
+def travel_minutes(distance_km):
+    return round(distance_km * ROAD_FACTOR / AVERAGE_SPEED_KMH * 60)
+
+def format_time(minutes):
+    hours, minutes = divmod(int(minutes) % (24 * 60), 60)
+    return f"{hours % 12 or 12}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+def _nearest(places, point, exclude=()):
+    candidates = [place for place in places if _has_location(place) and place['place_id'] not in exclude]
+    if not candidates:
+        candidates = [place for place in places if place['place_id'] not in exclude] or list(places)
+    if not candidates:
+        return None
+    if point is None:
+        return candidates[0]
+    return min(candidates, key=lambda place: (
+        haversine_km(point, _point(place)) if _has_location(place) else math.inf, place['place_id']
+    ))
+
+def _stop(activity, place):
+    return {
+        "activity": activity,
+        "place_id": place.get('place_id'),
+        "place_name": place.get('name'),
+        "rating": place.get('rating'),
+        "review": place.get('review') or "No review available",
+        "google_maps_url": place.get('google_maps_url') or "",
+        "website_url": place.get('website'),
+        "location": place.get('location') or {},
+    }
+
+def _schedule(stops):
+    """Fill in time and estimated_travel_time for one day's ordered stops."""
+    clock = DAY_START_MINUTES
+    for i, stop in enumerate(stops):
+        if stop["activity"] == "Dinner":
+            clock = max(clock, DINNER_NOT_BEFORE)
+        elif stop["activity"] == "Accommodation":
+            clock = max(clock, CHECK_IN_NOT_BEFORE)
+        stop["time"] = format_time(clock)
+        clock += ATTRACTION_MINUTES if stop["activity"] == "Sightseeing" else MEAL_MINUTES
+
+        following = stops[i + 1] if i + 1 < len(stops) else None
+        if following and _has_location(stop) and _has_location(following):
+            minutes = travel_minutes(haversine_km(_point(stop), _point(following)))
+            stop["estimated_travel_time"] = f"{minutes} mins"
+            clock += minutes
+        else:
+            stop["estimated_travel_time"] = "N/A"
+    return stops
+
+def plan_itinerary(no_of_days, attractions, restaurants, accommodations):
+    """Build the day-by-day skeleton without the LLM.
+
+    Attractions are clustered per day and visited in a nearest-neighbour +
+    2-opt order starting from the hotel. Breakfast is near the hotel, lunch
+    near the midday stop and dinner near the last attraction, preferring
+    restaurants not used yet. Returns {"Day N": [stop, ...]}; stops have no
+    description yet.
+    """
+    hotel = accommodations[0] if accommodations else None
+    hotel_point = _point(hotel) if hotel and _has_location(hotel) else None
+    used_restaurants = {}
+
+    def pick_restaurant(point, taken_today):
+        # Prefer restaurants used least across the trip, then the nearest one
+        available = [r for r in restaurants if r['place_id'] not in taken_today]
+        least_used = min((used_restaurants.get(r['place_id'], 0) for r in available), default=0)
+        pool = [r for r in available if used_restaurants.get(r['place_id'], 0) == least_used]
+        restaurant = _nearest(pool or restaurants, point, exclude=taken_today)
+        if restaurant:
+            used_restaurants[restaurant['place_id']] = used_restaurants.get(restaurant['place_id'], 0) + 1
+            taken_today.add(restaurant['place_id'])
+        return restaurant
+
+    itinerary = {}
+    for day, day_attractions in enumerate(assign_places_to_days(attractions, no_of_days), start=1):
+        located = [place for place in day_attractions if _has_location(place)]
+        if located:
+            points = ([hotel_point] if hotel_point else []) + [_point(place) for place in located]
+            order = order_stops(distance_matrix(points))
+            if hotel_point:
+                order = [i - 1 for i in order[1:]]
+            day_attractions = [located[i] for i in order] + [
+                place for place in day_attractions if not _has_location(place)
+            ]
+
+        taken_today = set()
+        stops = []
+        breakfast = pick_restaurant(hotel_point, taken_today)
+        if breakfast:
+            stops.append(_stop("Breakfast", breakfast))
+
+        midday = (len(day_attractions) + 1) // 2
+        for i, attraction in enumerate(day_attractions):
+            if i == midday:
+                lunch = pick_restaurant(_point(attraction) if _has_location(attraction) else None, taken_today)
+                if lunch:
+                    stops.append(_stop("Lunch", lunch))
+            stops.append(_stop("Sightseeing", attraction))
+        if midday >= len(day_attractions):
+            last = day_attractions[-1] if day_attractions else None
+            lunch = pick_restaurant(_point(last) if last and _has_location(last) else hotel_point, taken_today)
+            if lunch:
+                stops.append(_stop("Lunch", lunch))
+
+        last_point = next((_point(stop) for stop in reversed(stops) if _has_location(stop)), hotel_point)
+        dinner = pick_restaurant(last_point, taken_today)
+        if dinner:
+            stops.append(_stop("Dinner", dinner))
+        if hotel:
+            stops.append(_stop("Accommodation", hotel))
+
+        itinerary[f"Day {day}"] = _schedule(stops)
+    return itinerary
@@ -0,0 +1,279 @@
+import logging
+import math
+import os
+from string import Template
+from . import metrics
+from .schemas import GeneratedStop
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the estimated size of one prompt. Candidate lists are
+# trimmed (lowest rated first) until the prompt fits.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+# Rough characters-per-token ratio for Gemini on English text; good enough for
+# budgeting without a count_tokens round trip
+CHARS_PER_TOKEN = 4
+# Never trim a category below this many candidates
+MIN_CANDIDATES = 3
+
+# Bump whenever the templates or the response format change, so stored
+# itineraries generated from older prompts are no longer served
+PROMPT_VERSION = "2"
+
+# Ask Gemini for JSON constrained to a response schema instead of free text
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", "true").lower() in ("1", "true", "yes")
+
+ID_PREFIXES = {"attraction": "A", "restaurant": "R", "hotel": "H"}
+# Places in the descriptions prompt are P1, P2, ... whatever their category
+DESCRIPTION_ID_PREFIX = "P"
+
+# The model only picks places and writes descriptions; names, ratings, reviews,
+# URLs and locations are filled back in from our own data by rehydrate_stop()
+ITINERARY_ACTIVITY_FORMAT = """
+    {
+      "Day 1": [
+        {"time": "8:00 AM", "activity": "Breakfast", "id": "R1", "description": "Brief description"},
+        {"time": "9:30 AM", "activity": "Sightseeing", "id": "A4", "description": "Brief description"}
+      ]
+    }
+"""
+
+ITINERARY_TEMPLATE = Template("""
+    Generate a day-by-day itinerary for a trip to $destination for $no_of_days days.
+    The traveler prefers $food_preference food.
+
+    Places are listed as ID: name (rating) @lat,lng.
+    Tourist Attractions:
+$attractions
+    Restaurants:
+$restaurants
+    Accommodations:
+$accommodations
+
+    Instructions:
+    - For each day, include breakfast, 2-3 tourist attractions, lunch, dinner, and accommodation.
+    - Consider proximity of locations and food preferences.
+    - Refer to places only by their ID.
+
+    Output Format:
+    A valid JSON object with a key for each day ("Day 1", "Day 2", ...), each a list of activities:
+    $activity_format
+""")
+
+DAYS_TEMPLATE = Template("""
+    Generate part of a $no_of_days-day itinerary for a trip to $destination.
+    The traveler prefers $food_preference food.
+
+    Places are listed as ID: name (rating) @lat,lng.
+    Plan only these days, visiting the tourist attractions listed for each day:
+$day_plans
+    Restaurants:
+$restaurants
+    Accommodation for every night:
+$accommodations
+
+    Instructions:
+    - For each day, include breakfast, the listed tourist attractions, lunch, dinner, and accommodation.
+    - Consider proximity of locations and food preferences.
+    - Refer to places only by their ID.
+
+    Output Format:
+    A valid JSON object with exactly these keys: $day_keys, each a list of activities:
+    $activity_format
+""")
+
+DESCRIPTIONS_TEMPLATE = Template("""
+    Write a brief, engaging description (one or two sentences) of each place below
+    for a traveler visiting $destination who prefers $food_preference food.
+
+    Places (ID: name, activity):
+$places
+
+    Output Format:
+    A valid JSON object mapping each place ID to its description.
+""")
+
+class PromptTooLarge(Exception):
+    """The prompt exceeds PROMPT_TOKEN_BUDGET even with candidates trimmed to the minimum."""
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+class PlaceCatalog:
+    """Short prompt IDs for candidate places, and the places they stand for.
+
+    Gemini sees "A3" instead of a full place dict; rehydrate_stop() turns the
+    stops it returns back into full activities.
+    """
+
+    def __init__(self, attractions, restaurants, accommodations):
+        self.places = {}
+        self.ids = {}
+        for category, places in (("attraction", attractions), ("restaurant", restaurants), ("hotel", accommodations)):
+            self.ids[category] = []
+            for index, place in enumerate(places, start=1):
+                place_id = f"{ID_PREFIXES[category]}{index}"
+                self.places[place_id] = place
+                self.ids[category].append(place_id)
+
+    def line(self, place_id):
+        place = self.places[place_id]
+        line = f"    {place_id}: {place.get('name')}"
+        if place.get('rating') is not None:
+            line += f" ({place['rating']})"
+        location = place.get('location') or {}
+        if 'lat' in location and 'lng' in location:
+            line += f" @{location['lat']:.4f},{location['lng']:.4f}"
+        return line
+
+    def lines(self, place_ids):
+        return "\n".join(self.line(place_id) for place_id in place_ids) or "    (none)"
+
+    def rehydrate_stop(self, stop):
+        """Return the full activity for a compact stop, or None if its ID is unknown."""
+        if not isinstance(stop, dict):
+            return None
+        place = self.places.get(str(stop.get("id", "")).strip())
+        if place is None:
+            return None
+        return {
+            "time": stop.get("time"),
+            "activity": stop.get("activity"),
+            "place_name": place.get('name'),
+            "description": stop.get("description") or place.get('review') or "",
+            "rating": place.get('rating'),
+            "review": place.get('review') or "No review available",
+            "google_maps_url": place.get('google_maps_url') or "",
+            "website_url": place.get('website'),
+            "estimated_travel_time": stop.get("estimated_travel_time", "N/A"),
+            "location": place.get('location') or {},
+        }
+
+    def rehydrate_day(self, stops):
+        """Rehydrate one day's stops, dropping any that reference unknown IDs."""
+        if not isinstance(stops, list):
+            return None
+        activities = [self.rehydrate_stop(stop) for stop in stops]
+        dropped = activities.count(None)
+        if dropped:
+            logger.warning(f"Dropped {dropped} stops with unknown place IDs")
+        return [activity for activity in activities if activity is not None]
+
+    def rehydrate(self, itinerary_data):
+        rehydrated = {}
+        for day, stops in itinerary_data.items():
+            activities = self.rehydrate_day(stops)
+            if activities is not None:
+                rehydrated[day] = activities
+        return rehydrated
+
+def _by_rating(places):
+    return sorted(places, key=lambda place: place.get('rating') or 0, reverse=True)
+
+def fit_to_budget(render, candidates, budget=None):
+    """Render a prompt from candidate lists, trimming them until it fits the budget.
+
+    candidates maps a name to a list of places; render(**candidates) returns
+    (prompt, PlaceCatalog). The longest list loses its lowest-rated place
+    until the estimate is within budget. Returns what render returned last.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    candidates = {name: _by_rating(places) for name, places in candidates.items()}
+    while True:
+        prompt, places = render(**candidates)
+        tokens = estimate_tokens(prompt)
+        if tokens <= budget:
+            break
+        longest = max(candidates, key=lambda name: len(candidates[name]))
+        if len(candidates[longest]) <= MIN_CANDIDATES:
+            raise PromptTooLarge(f"Prompt needs ~{tokens} tokens, budget is {budget}")
+        candidates[longest] = candidates[longest][:-1]
+    metrics.record_prompt_tokens(tokens)
+    logger.debug(f"Prompt estimated at {tokens} tokens (budget {budget})")
+    return prompt, places
+
+def build_itinerary_prompt(destination, no_of_days, food_preference, attractions, restaurants, accommodations):
+    """Return (prompt, PlaceCatalog) for a whole itinerary."""
+    def render(attractions, restaurants, accommodations):
+        places = PlaceCatalog(attractions, restaurants, accommodations)
+        prompt = ITINERARY_TEMPLATE.substitute(
+            destination=destination,
+            no_of_days=no_of_days,
+            food_preference=food_preference,
+            attractions=places.lines(places.ids["attraction"]),
+            restaurants=places.lines(places.ids["restaurant"]),
+            accommodations=places.lines(places.ids["hotel"]),
+            activity_format=ITINERARY_ACTIVITY_FORMAT,
+        )
+        return prompt, places
+
+    return fit_to_budget(render, {
+        "attractions": attractions, "restaurants": restaurants, "accommodations": accommodations,
+    })
+
+def build_days_prompt(destination, no_of_days, day_numbers, food_preference, day_attractions, restaurants, accommodation):
+    """Return (prompt, PlaceCatalog) for a subset of days; day_attractions maps day number to its attractions."""
+    attractions = [place for day in day_numbers for place in day_attractions[day]]
+
+    def render(restaurants):
+        places = PlaceCatalog(attractions, restaurants, accommodation)
+        attraction_ids = iter(places.ids["attraction"])
+        day_plans = "\n".join(
+            f"    Day {day}: {', '.join(next(attraction_ids) for _ in day_attractions[day]) or '(free day)'}"
+            for day in day_numbers
+        )
+        prompt = DAYS_TEMPLATE.substitute(
+            destination=destination,
+            no_of_days=no_of_days,
+            food_preference=food_preference,
+            day_plans=day_plans + "\n    Tourist Attractions:\n" + places.lines(places.ids["attraction"]),
+            restaurants=places.lines(places.ids["restaurant"]),
+            accommodations=places.lines(places.ids["hotel"]),
+            day_keys=", ".join(f'"Day {day}"' for day in day_numbers),
+            activity_format=ITINERARY_ACTIVITY_FORMAT,
+        )
+        return prompt, places
+
+    # Attractions are already fixed per day, so only restaurants are trimmed
+    return fit_to_budget(render, {"restaurants": restaurants})
+
+def build_descriptions_prompt(destination, food_preference, places):
+    """places maps a short ID to (name, activity)."""
+    prompt = DESCRIPTIONS_TEMPLATE.substitute(
+        destination=destination,
+        food_preference=food_preference,
+        places="\n".join(f"    {place_id}: {name}, {activity}" for place_id, (name, activity) in places.items()),
+    )
+    metrics.record_prompt_tokens(estimate_tokens(prompt))
+    return prompt
+
+def _object_schema(model):
+    """Gemini response schema for a flat Pydantic model."""
+    schema = model.model_json_schema()
+    return {
+        "type": "object",
+        "properties": {name: {"type": field["type"]} for name, field in schema["properties"].items()},
+        "required": schema.get("required", []),
+    }
+
+def _json_config(response_schema):
+    if not GEMINI_JSON_MODE:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+def itinerary_generation_config(day_keys):
+    """generation_config constraining output to {day: [GeneratedStop, ...]} for exactly day_keys."""
+    stop = _object_schema(GeneratedStop)
+    return _json_config({
+        "type": "object",
+        "properties": {day: {"type": "array", "items": stop} for day in day_keys},
+        "required": list(day_keys),
+    })
+
+def descriptions_generation_config(place_ids):
+    """generation_config constraining output to {place_id: description}."""
+    return _json_config({
+        "type": "object",
+        "properties": {place_id: {"type": "string"} for place_id in place_ids},
+        "required": list(place_ids),
+    })
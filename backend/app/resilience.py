@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+import httpx
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.25"))
+UPSTREAM_BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# Retries may add at most RETRY_BUDGET_RATIO extra calls per call made,
+# with up to RETRY_BUDGET_MAX_TOKENS saved up for bursts
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))
+
+class UpstreamError(Exception):
+    """An upstream call failed after the retries it was allowed."""
+
+class CircuitOpenError(UpstreamError):
+    """The upstream's circuit breaker is open, so the call was not attempted."""
+
+class DeadlineExceeded(UpstreamError):
+    """The request deadline ran out before the upstream call could finish."""
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+@contextmanager
+def request_deadline(seconds):
+    """Bound every upstream call made inside the block to seconds from now.
+
+    Pass None to run without a deadline, e.g. for background work started
+    from a request.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Let a single trial call through to probe the upstream
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class RetryBudget:
+    def __init__(self, ratio, max_tokens):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_call(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class Upstream:
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX_TOKENS)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def state(self):
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+_upstreams = {}
+
+def get_upstream(name):
+    if name not in _upstreams:
+        _upstreams[name] = Upstream(name)
+    return _upstreams[name]
+
+def upstream_states():
+    return {name: upstream.state() for name, upstream in _upstreams.items()}
+
+def is_retryable(exc):
+    """Transient failures worth retrying and counting against the breaker."""
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    code = getattr(exc, "code", None)
+    # google.api_core exceptions carry the HTTP status as .code
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry number (1-based)."""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_CAP, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+async def call_upstream(name, make_call, max_attempts=None):
+    """Run make_call() against the named upstream with breaker, retries and deadline.
+
+    make_call is a zero-argument function returning a new awaitable per
+    attempt. Non-transient errors are raised unchanged; transient errors are
+    retried while the breaker, retry budget and request deadline allow, and
+    then raised as UpstreamError.
+    """
+    upstream = get_upstream(name)
+    max_attempts = max_attempts or UPSTREAM_MAX_ATTEMPTS
+    upstream.budget.record_call()
+
+    for attempt in range(1, max_attempts + 1):
+        if not upstream.breaker.allow():
+            upstream.rejected += 1
+            metrics.record_upstream_call(name, "rejected", 0.0)
+            raise CircuitOpenError(f"Circuit for {name} is open")
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline exceeded before calling {name}")
+
+        upstream.calls += 1
+        started = time.perf_counter()
+        try:
+            if remaining is None:
+                result = await make_call()
+            else:
+                result = await asyncio.wait_for(make_call(), timeout=remaining)
+        except asyncio.CancelledError:
+            upstream.breaker.release_trial()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and remaining is not None and remaining_time() <= 0:
+                # The caller's request deadline ran out rather than the upstream's
+                # own timeout; that says nothing about the upstream's health, so
+                # it doesn't count against the breaker
+                upstream.breaker.release_trial()
+                metrics.record_upstream_call(name, "deadline", time.perf_counter() - started)
+                raise DeadlineExceeded(f"Request deadline exceeded while calling {name}") from e
+            if not is_retryable(e):
+                # The upstream answered; the problem is with this request
+                upstream.breaker.record_success()
+                metrics.record_upstream_call(name, "client_error", time.perf_counter() - started)
+                raise
+            metrics.record_upstream_call(name, "failure", time.perf_counter() - started)
+            upstream.failures += 1
+            upstream.breaker.record_failure()
+            logger.warning(f"Call to {name} failed (attempt {attempt}/{max_attempts}): {str(e) or type(e).__name__}")
+
+            delay = backoff_delay(attempt)
+            remaining = remaining_time()
+            if attempt == max_attempts:
+                raise UpstreamError(f"Call to {name} failed: {str(e) or type(e).__name__}") from e
+            if remaining is not None and remaining <= delay:
+                raise DeadlineExceeded(f"Request deadline leaves no time to retry {name}") from e
+            if not upstream.budget.try_spend():
+                raise UpstreamError(f"Call to {name} failed and its retry budget is exhausted") from e
+            upstream.retries += 1
+            metrics.record_upstream_retry(name)
+            await asyncio.sleep(delay)
+        else:
+            metrics.record_upstream_call(name, "success", time.perf_counter() - started)
+            upstream.breaker.record_success()
+            return result
@@ -1,6 +1,11 @@
-from pydantic import BaseModel
+import logging
+from pydantic import BaseModel, BeforeValidator, field_validator
 from typing import List, Dict, Any, Optional
+from typing_extensions import Annotated
 from datetime import datetime
+from .itinerary_model import ActivityResponse, repair_activity
+
+logger = logging.getLogger(__name__)
 
 class UserBase(BaseModel):
     email: str
@@ -22,28 +27,59 @@ class ItineraryRequest(BaseModel):
     no_of_days: int
     food_preference: str
 
-class ActivityDetail(BaseModel):
-    time: str
-    activity: str
-    place_name: str
-    description: str
-    rating: float
-    review: str
-    google_maps_url: str
-    website_url: Optional[str]
-    estimated_travel_time: str
-    location: Dict[str, float]
-    distance_to_next: Optional[str]
+# One stop of an itinerary. Field-level defects (a rating given as text, a
+# location with other key names, a missing description) are repaired by
+# itinerary_model's repair_activity instead of failing the whole itinerary;
+# the shape is itinerary_model.ActivityResponse, which responses are built in.
+ActivityDetail = Annotated[ActivityResponse, BeforeValidator(repair_activity)]
 
 class ItineraryDay(BaseModel):
     activities: List[ActivityDetail]
 
+    @field_validator("activities", mode="before")
+    @classmethod
+    def _drop_unusable(cls, activities):
+        # A stop without a place can't be repaired; drop it rather than the day
+        if not isinstance(activities, list):
+            return []
+        usable = [activity for activity in activities
+                  if isinstance(activity, dict) and isinstance(activity.get("place_name"), str) and activity["place_name"]]
+        if len(usable) < len(activities):
+            logger.warning(f"Dropped {len(activities) - len(usable)} activities without a place")
+        return usable
+
+class FullItinerary(BaseModel):
+    itinerary: Dict[str, ItineraryDay]
+
+class Job(BaseModel):
+    job_id: str
+    status: str
+    destination: str
+    no_of_days: int
+    food_preference: str
+    priority: str
+    itinerary_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Filled in once the job is done
+    itinerary: Optional[FullItinerary] = None
+
+class GeneratedStop(BaseModel):
+    """A stop as Gemini returns it; everything else is filled in from our place data."""
+    time: str
+    activity: str
+    id: str
+    description: str
+
 class ItineraryCreate(BaseModel):
     days: Dict[str, List[ActivityDetail]]
 
 class Itinerary(ItineraryCreate):
     id: int
-    owner_id: int
+    # None for itineraries stored by the generator rather than saved by a user
+    owner_id: Optional[int]
 
     class Config:
         from_attributes = True
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lease only if it is still held by the caller's token
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class _LeaderCancelled(Exception):
+    """Handed to followers when the leader's own task was cancelled."""
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    Callers in the same process await the leader's future. Across workers a
+    Redis lease elects one leader, which publishes its JSON result for the
+    followers polling Redis. If Redis is unavailable every process simply
+    computes on its own.
+    """
+
+    def __init__(self, namespace: str, lease_ttl: float, result_ttl: int,
+                 wait_timeout: float, poll_interval: float = 0.25):
+        self.namespace = namespace
+        self.lease_ttl = lease_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The leader was cancelled (client gone, deadline); try again,
+                # possibly as the new leader
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        # Followers may all have gone away; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await self._do_shared(key, fn)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Cancellation belongs to the leader's caller, not to the followers
+            future.set_exception(_LeaderCancelled())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _do_shared(self, key, fn):
+        redis = get_redis()
+        if redis is None:
+            return await fn()
+
+        lease_key = f"{self.namespace}:lease:{key}"
+        result_key = f"{self.namespace}:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            try:
+                raw = await redis.get(result_key)
+                acquired = raw is None and await redis.set(
+                    lease_key, token, nx=True, px=int(self.lease_ttl * 1000)
+                )
+            except Exception as e:
+                logger.warning(f"Single-flight coordination failed for {key}: {str(e)}")
+                break
+            if raw is not None:
+                return json.loads(raw)
+            if acquired:
+                return await self._lead(redis, lease_key, result_key, token, fn)
+            await asyncio.sleep(self.poll_interval)
+        else:
+            logger.warning(f"Timed out waiting for in-flight computation of {key}")
+        return await fn()
+
+    async def _lead(self, redis, lease_key, result_key, token, fn):
+        renewer = asyncio.create_task(self._renew(redis, lease_key, token))
+        try:
+            # A previous leader may have published just before we took the lease
+            raw = await redis.get(result_key)
+            if raw is not None:
+                return json.loads(raw)
+            result = await fn()
+            # Publish before releasing the lease so waiting followers never miss it
+            if result is not None:
+                try:
+                    await redis.set(result_key, json.dumps(result), ex=self.result_ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to publish single-flight result {result_key}: {str(e)}")
+            return result
+        finally:
+            renewer.cancel()
+            try:
+                await redis.eval(_RELEASE_SCRIPT, 1, lease_key, token)
+            except Exception as e:
+                logger.warning(f"Failed to release single-flight lease {lease_key}: {str(e)}")
+
+    async def _renew(self, redis, lease_key, token):
+        # Keep the lease alive while the leader is still working
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if await redis.get(lease_key) == token:
+                    await redis.pexpire(lease_key, int(self.lease_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Failed to renew single-flight lease {lease_key}: {str(e)}")
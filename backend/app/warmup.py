@@ -0,0 +1,237 @@
+"""Pre-generate itineraries for popular trips so users never wait for them.
+
+Popular trips come from WARMUP_TRIPS_FILE and from the request counts that
+/generate_itinerary/ keeps in Redis. Each trip is served from the itinerary
+store when possible and generated otherwise, through the same single-flight
+path as the API (which also fills the place and distance caches), then
+written to the response cache. Generations are paced to
+WARMUP_TRIPS_PER_MINUTE.
+
+The app runs this on a schedule; to run it once by hand, from the backend
+directory:
+
+    python -m app.warmup --limit 20 --rate 4
+    python -m app.warmup --file popular_trips.json --dry-run
+
+WARMUP_TRIPS_FILE / --file is a JSON list such as
+[{"destination": "Paris", "days": [3, 5], "food": ["any", "vegetarian"]}].
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+from dotenv import load_dotenv
+
+# Load .env before the app modules read their configuration (python -m app.warmup)
+load_dotenv()
+
+from fastapi import Query
+from . import cache as app_cache
+from . import itinerary_generator, itinerary_model, itinerary_store
+from .catalog import canonical_destination, food_bucket
+from .concurrency import GenerationSaturated
+from .itinerary_service import generate_itinerary_once
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds between scheduled runs; one worker process runs each round
+WARMUP_INTERVAL = int(os.getenv("WARMUP_INTERVAL", "1800"))
+WARMUP_INITIAL_DELAY = int(os.getenv("WARMUP_INITIAL_DELAY", "60"))
+# How many of the most requested trips to keep warm
+WARMUP_TRIPS = int(os.getenv("WARMUP_TRIPS", "50"))
+# Rate budget for upstream work: trips actually generated (Places, Gemini and
+# ORS calls) per minute. Trips served from the itinerary store are free.
+WARMUP_TRIPS_PER_MINUTE = float(os.getenv("WARMUP_TRIPS_PER_MINUTE", "4"))
+WARMUP_TRIPS_FILE = os.getenv("WARMUP_TRIPS_FILE")
+# Request counts are kept per day; popularity sums the last WARMUP_WINDOW_DAYS
+WARMUP_WINDOW_DAYS = int(os.getenv("WARMUP_WINDOW_DAYS", "7"))
+# Response cache entries with less than this many seconds left are re-warmed
+WARMUP_REFRESH_BEFORE = int(os.getenv("WARMUP_REFRESH_BEFORE", str(WARMUP_INTERVAL + 300)))
+
+POPULARITY_PREFIX = "warmup:popularity"
+LOCK_KEY = "warmup:lock"
+
+# Request counting tasks in flight, so they aren't garbage collected
+_count_tasks = set()
+
+def _popularity_key(day):
+    return f"{POPULARITY_PREFIX}:{day:%Y%m%d}"
+
+def trip_key(destination, no_of_days, food_preference):
+    """The trip as it is counted and warmed: canonical destination and food bucket."""
+    return (canonical_destination(destination), int(no_of_days), food_bucket(food_preference))
+
+async def _count(member):
+    redis = app_cache.get_redis()
+    if redis is None:
+        return
+    key = _popularity_key(datetime.utcnow())
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zincrby(key, 1, member)
+            pipe.expire(key, (WARMUP_WINDOW_DAYS + 1) * 24 * 3600)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug(f"Could not count trip request: {str(e)}")
+
+async def count_trip_request(
+    destination: str = Query(...),
+    no_of_days: int = Query(...),
+    food_preference: str = Query(...),
+):
+    """Route dependency counting the trip towards popularity once it has been served.
+
+    Runs on cache hits too; requests that are rate limited or fail raise
+    through the yield and are not counted.
+    """
+    yield
+    task = asyncio.create_task(_count(json.dumps(trip_key(destination, no_of_days, food_preference))))
+    _count_tasks.add(task)
+    task.add_done_callback(_count_tasks.discard)
+
+def load_trips_file(path):
+    """Trips listed in a WARMUP_TRIPS_FILE-style JSON file."""
+    with open(path) as f:
+        entries = json.load(f)
+    trips = []
+    for entry in entries:
+        for days in entry.get("days", [3]):
+            for food in entry.get("food", ["any"]):
+                trips.append(trip_key(entry["destination"], days, food))
+    return trips
+
+async def requested_trips(limit):
+    """The most requested trips over the last WARMUP_WINDOW_DAYS, most popular first."""
+    redis = app_cache.get_redis()
+    if redis is None:
+        return []
+    today = datetime.utcnow()
+    keys = [_popularity_key(today - timedelta(days=offset)) for offset in range(WARMUP_WINDOW_DAYS)]
+    window = f"{POPULARITY_PREFIX}:window"
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(window, keys)
+        pipe.zrevrange(window, 0, limit - 1)
+        _, members = await pipe.execute()
+    return [tuple(json.loads(member)) for member in members]
+
+async def popular_trips(limit=WARMUP_TRIPS, trips_file=WARMUP_TRIPS_FILE):
+    """Trips from the file first (in file order), then the most requested ones."""
+    trips = []
+    if trips_file:
+        try:
+            trips.extend(load_trips_file(trips_file))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not read warm-up trips from {trips_file}: {str(e)}")
+    try:
+        trips.extend(await requested_trips(limit))
+    except Exception as e:
+        logger.warning(f"Could not read trip popularity: {str(e)}")
+    return list(dict.fromkeys(trips))[:limit]
+
+async def _cache_ttl(key):
+    redis = app_cache.get_redis()
+    if redis is None:
+        return -2
+    try:
+        return await redis.ttl(key)
+    except Exception:
+        return -2
+
+async def warm_trip(destination, no_of_days, food_preference, limiter=None):
+    """Make sure the trip is in the response cache. Returns what it took:
+    "cached", "stored", "generated", "busy" or "failed"."""
+    key = app_cache.itinerary_response_key(destination, no_of_days, food_preference)
+    if await _cache_ttl(key) > WARMUP_REFRESH_BEFORE:
+        return "cached"
+
+    outcome = "stored"
+    stored = await asyncio.to_thread(
+        itinerary_store.load_itinerary, destination, no_of_days, food_preference, itinerary_generator.GENERATOR_VERSION
+    )
+    itinerary_data = stored[1] if stored is not None else None
+    if itinerary_data is None:
+        outcome = "generated"
+        # In the app, only use an idle generation slot: users come first
+        if limiter is not None and limiter.running >= limiter.max_concurrent:
+            return "busy"
+        try:
+            # Shares the run with users asking for the same trip meanwhile
+            _, itinerary_data = await generate_itinerary_once(destination, no_of_days, food_preference)
+        except GenerationSaturated:
+            return "busy"
+        if itinerary_data is None:
+            return "failed"
+
+    redis = app_cache.get_redis()
+    if redis is not None:
+        body = itinerary_model.Itinerary.from_days(itinerary_data).dumps()
+        await redis.set(key, app_cache.CompressedJsonCoder.pack(body), ex=app_cache.RESPONSE_CACHE_TTL)
+    return outcome
+
+async def warm(trips, rate=WARMUP_TRIPS_PER_MINUTE, limiter=None):
+    """Warm each trip in order, pacing generations to rate per minute. Returns outcome counts."""
+    outcomes = {}
+    for destination, no_of_days, food_preference in trips:
+        try:
+            outcome = await warm_trip(destination, no_of_days, food_preference, limiter)
+        except Exception as e:
+            logger.exception(f"Warm-up failed for {destination}, {no_of_days} days, {food_preference}: {str(e)}")
+            outcome = "failed"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        logger.info(f"Warm-up {destination}, {no_of_days} days, {food_preference}: {outcome}")
+        if outcome in ("generated", "failed") and rate > 0:
+            await asyncio.sleep(60 / rate)
+    return outcomes
+
+async def run_warmup_scheduler(limiter=None):
+    """Background task for the app: warm popular trips every WARMUP_INTERVAL seconds."""
+    await asyncio.sleep(WARMUP_INITIAL_DELAY)
+    while True:
+        try:
+            redis = app_cache.get_redis()
+            # With several worker processes, only the one holding the lock warms this round
+            if redis is None or await redis.set(LOCK_KEY, "1", nx=True, ex=WARMUP_INTERVAL):
+                outcomes = await warm(await popular_trips(), limiter=limiter)
+                logger.info(f"Warm-up finished: {outcomes}")
+        except Exception as e:
+            logger.exception(f"Warm-up run failed: {str(e)}")
+        await asyncio.sleep(WARMUP_INTERVAL)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=WARMUP_TRIPS, help="number of trips to warm")
+    parser.add_argument("--rate", type=float, default=WARMUP_TRIPS_PER_MINUTE, help="generations per minute")
+    parser.add_argument("--file", default=WARMUP_TRIPS_FILE, help="JSON list of trips to warm first")
+    parser.add_argument("--dry-run", action="store_true", help="only print the trips that would be warmed")
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    import aioredis
+    from . import catalog, metrics, models
+    from .database import engine
+    from .http_client import close_http_client
+
+    metrics.configure_logging()
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        itinerary_store.upgrade_schema(conn)
+        catalog.upgrade_schema(conn)
+    redis = aioredis.from_url(os.getenv("REDIS_URL", "redis://redis"), encoding="utf8", decode_responses=True)
+    app_cache.set_redis(redis)
+    try:
+        trips = await popular_trips(args.limit, args.file)
+        if args.dry_run:
+            for trip in trips:
+                print(*trip, sep="\t")
+            return
+        print(json.dumps(await warm(trips, args.rate)))
+    finally:
+        await close_http_client()
+        await redis.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
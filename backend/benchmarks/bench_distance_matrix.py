@@ -0,0 +1,48 @@
+"""Compare the vectorized haversine matrix against per-pair geopy calls.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_distance_matrix --places 15 --repeat 200
+"""
+import argparse
+import random
+import timeit
+
+from geopy.distance import geodesic, great_circle
+
+from app.geo import haversine_matrix
+
+def random_places(count, seed=42):
+    rng = random.Random(seed)
+    # Spread over a city-sized box around Paris
+    return [(48.8 + rng.random() * 0.15, 2.25 + rng.random() * 0.2) for _ in range(count)]
+
+def geopy_matrix(points, metric):
+    return [[metric(a, b).km for b in points] for a in points]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--places", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    points = random_places(args.places)
+    vectorized = haversine_matrix(points)
+    reference = geopy_matrix(points, great_circle)
+    max_error = max(abs(vectorized[i][j] - reference[i][j])
+                    for i in range(len(points)) for j in range(len(points)))
+    print(f"{args.places} places, {args.places ** 2} pairs, max |numpy - great_circle| = {max_error:.6f} km")
+
+    candidates = {
+        "numpy haversine_matrix": lambda: haversine_matrix(points),
+        "geopy great_circle per pair": lambda: geopy_matrix(points, great_circle),
+        "geopy geodesic per pair": lambda: geopy_matrix(points, geodesic),
+    }
+    baseline = None
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=args.repeat, repeat=3)) / args.repeat
+        baseline = baseline or seconds
+        print(f"{name:<30} {seconds * 1e6:>12.1f} us/matrix  {seconds / baseline:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark itinerary generation offline against stubbed upstreams.
+
+Runs generate_itinerary directly (--target generator) or the HTTP routes
+in-process (--target http, needs Redis at REDIS_URL for the response cache
+and rate limiter) and reports latency percentiles, throughput and upstream
+call counts. No Google, ORS or Gemini keys are needed.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_generation --requests 100 --concurrency 20 --days 3
+    python -m benchmarks.bench_generation --gemini-latency 0.5 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["generator", "http"], default="generator")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--destinations", type=int, default=10,
+                        help="distinct destinations to cycle through; fewer means warmer caches")
+    parser.add_argument("--food", default="local")
+    parser.add_argument("--places-latency", type=float, default=0.2)
+    parser.add_argument("--details-latency", type=float, default=0.15)
+    parser.add_argument("--ors-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of upstream calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def configure_environment():
+    # Must happen before the app is imported
+    os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIzaStubKeyForOfflineBenchmarks000000000")
+    os.environ.setdefault("GOOGLE_AI_API_KEY", "stub")
+    os.environ.setdefault("ORS_API_KEY", "stub")
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    )
+
+async def run_requests(args, call):
+    destinations = [f"Bench City {i}" for i in range(args.destinations)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(destinations[i % len(destinations)], args.days, args.food)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    return latencies, errors, time.perf_counter() - start
+
+async def main():
+    args = parse_args()
+    configure_environment()
+
+    import httpx
+    from benchmarks.stubs import StubGemini, StubUpstreams
+    from app import clients, database, http_client, itinerary_generator, models
+
+    upstreams = StubUpstreams(
+        latency={"places": args.places_latency, "details": args.details_latency, "ors": args.ors_latency},
+        error_rate=args.error_rate, seed=args.seed,
+    )
+    gemini = StubGemini(latency=args.gemini_latency, error_rate=args.error_rate, seed=args.seed)
+    http_client.set_http_client(httpx.AsyncClient(transport=upstreams))
+    clients.override("gemini", gemini)
+    models.Base.metadata.create_all(bind=database.engine)
+
+    if args.target == "generator":
+        async def call(destination, days, food):
+            result = await itinerary_generator.generate_itinerary(destination, days, food)
+            if result is None:
+                raise RuntimeError("generate_itinerary returned None")
+    else:
+        from fastapi_limiter import FastAPILimiter
+        from app import main as app_main
+        await app_main.startup()
+        # Give every request its own rate-limit identity so the limiter doesn't throttle the run
+        await FastAPILimiter.init(FastAPILimiter.redis, identifier=lambda request: uuid.uuid4().hex)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url="http://bench", timeout=None)
+
+        async def call(destination, days, food):
+            response = await client.get("/generate_itinerary/", params={
+                "destination": destination, "no_of_days": days, "food_preference": food,
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+    latencies, errors, elapsed = await run_requests(args, call)
+
+    print(f"target={args.target} requests={args.requests} concurrency={args.concurrency} "
+          f"days={args.days} destinations={args.destinations} error_rate={args.error_rate}")
+    print(f"ok={len(latencies)} errors={len(errors)} wall={elapsed:.2f}s "
+          f"throughput={len(latencies) / elapsed:.2f} req/s")
+    print("latency  p50={:.3f}s  p95={:.3f}s  p99={:.3f}s  max={:.3f}s".format(
+        percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+        max(latencies, default=float("nan")),
+    ))
+    calls = dict(upstreams.calls, gemini=gemini.calls)
+    print("upstream calls  " + "  ".join(
+        f"{name}={count} ({count / args.requests:.1f}/req)" for name, count in sorted(calls.items())
+    ))
+    for error in sorted(set(errors))[:5]:
+        print(f"error: {error}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Guard worker start time: import the app in fresh interpreters and check a budget.
+
+Each run imports the module in a new process (so nothing is cached in
+sys.modules), takes the median, and exits non-zero if it exceeds --budget
+or if any of the lazily loaded SDKs were imported eagerly. The pytest suite
+runs the same check for app.itinerary_generator (tests/test_import_time.py).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_import --module app.itinerary_generator --budget 1.0
+    python -m benchmarks.bench_import --module app.main --budget 2.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# SDKs that must only be imported on first use (see app/clients.py)
+LAZY_MODULES = ("google.generativeai", "googlemaps", "geopy")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "eager": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+def measure(module):
+    env = dict(os.environ)
+    # Importing must not need credentials or a reachable database
+    env.setdefault("DATABASE_URL", "sqlite://")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.itinerary_generator")
+    parser.add_argument("--budget", type=float, default=1.0, help="maximum median import time in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [measure(args.module) for _ in range(args.runs)]
+    seconds = [sample["seconds"] for sample in samples]
+    eager = sorted({name for sample in samples for name in sample["eager"]})
+    median = statistics.median(seconds)
+
+    print(f"import {args.module}: median {median * 1000:.0f} ms, "
+          f"min {min(seconds) * 1000:.0f} ms, max {max(seconds) * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)")
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if median > args.budget:
+        print("FAIL: import time over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
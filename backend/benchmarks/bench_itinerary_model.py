@@ -0,0 +1,118 @@
+"""Compare the itinerary representations on memory and serialization time.
+
+Builds a --days day itinerary with --stops activities per day (as stored in
+the itineraries table) and measures, per itinerary:
+
+  * memory held by the plain dicts, the Pydantic FullItinerary and the
+    slotted itinerary_model.Itinerary (tracemalloc);
+  * building a response on a cache miss: FullItinerary validation plus
+    FastAPI's response validation and JSON dump (the old route) against
+    Itinerary.from_days(...).dumps();
+  * serving a response cache hit: parsing the cached JSON and validating it
+    against the response model again (the old coder) against handing the
+    decompressed bytes straight back.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_itinerary_model --days 7 --stops 8 --repeat 500
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--stops", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--copies", type=int, default=50, help="itineraries held at once for the memory figures")
+    return parser.parse_args()
+
+def sample_days(days, stops):
+    return {
+        f"Day {day}": [
+            {
+                "time": f"{8 + stop}:00 AM",
+                "activity": "Sightseeing",
+                "place_name": f"Place {day}-{stop}",
+                "description": "A brief, engaging description of the place for the traveler.",
+                "rating": 4.5,
+                "review": "Lovely spot with friendly staff, well worth the visit.",
+                "google_maps_url": f"https://maps.google.com/?cid={day}{stop}",
+                "website_url": "https://example.com",
+                "estimated_travel_time": "12 mins",
+                "location": {"lat": 48.85 + stop / 1000, "lng": 2.35 + day / 1000},
+                "distance_to_next_km": 1.234,
+                "distance_estimated": stop % 2 == 0,
+            }
+            for stop in range(stops)
+        ]
+        for day in range(1, days + 1)
+    }
+
+def retained_bytes(build, copies):
+    """Average bytes held per object built by build()."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build() for _ in range(copies)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / copies
+
+def per_call_us(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    args = parse_args()
+    from pydantic import TypeAdapter
+    from app import schemas
+    from app.cache import CompressedJsonCoder
+    from app.itinerary_model import Itinerary
+
+    days = sample_days(args.days, args.stops)
+    stored = json.dumps(days)
+    wrapped = lambda d: {"itinerary": {day: {"activities": activities} for day, activities in d.items()}}
+    response_adapter = TypeAdapter(schemas.FullItinerary)
+
+    print(f"{args.days} days x {args.stops} stops")
+    print("memory per itinerary:")
+    for name, build in (
+        ("dicts", lambda: json.loads(stored)),
+        ("pydantic FullItinerary", lambda: schemas.FullItinerary.model_validate(wrapped(json.loads(stored)))),
+        ("itinerary_model.Itinerary", lambda: Itinerary.from_days(json.loads(stored))),
+    ):
+        print(f"  {name:<28} {retained_bytes(build, args.copies) / 1024:8.1f} KiB")
+
+    def old_miss():
+        itinerary = schemas.FullItinerary.model_validate(wrapped(days))
+        return response_adapter.dump_json(response_adapter.validate_python(itinerary))
+
+    def new_miss():
+        return Itinerary.from_days(days).dumps()
+
+    cached_old = CompressedJsonCoder.pack(json.loads(old_miss()))
+    cached_new = CompressedJsonCoder.pack(new_miss())
+
+    def old_hit():
+        return response_adapter.dump_json(response_adapter.validate_python(CompressedJsonCoder.decode(cached_old)))
+
+    def new_hit():
+        return CompressedJsonCoder.unpack(cached_new)
+
+    assert json.loads(old_miss()) == json.loads(new_miss())
+    print("per response:")
+    for name, old, new in (("cache miss", old_miss, new_miss), ("cache hit", old_hit, new_hit)):
+        before, after = per_call_us(old, args.repeat), per_call_us(new, args.repeat)
+        print(f"  {name:<12} pydantic {before:8.1f} us   itinerary_model {after:8.1f} us   {before / after:5.1f}x")
+    print(f"response size {len(new_miss())} bytes, cached {len(cached_new)} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Compare parse_llm_json with the old greedy-regex-then-json.loads extraction.
+
+Reports per-fixture time for both, and whether each recovered the response.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_llm_parser --repeat 200
+"""
+import argparse
+import json
+import re
+import timeit
+
+from app.llm_parser import parse_llm_json
+from benchmarks.llm_fixtures import load_fixtures
+
+def regex_extract(text):
+    match = re.search(r"{.*}", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<38} {'bytes':>7} {'regex us':>10} {'keys':>5} {'parser us':>10} {'keys':>5} {'failed':>7}")
+    for name, text, _ in load_fixtures():
+        regex_time = timeit.timeit(lambda: regex_extract(text), number=args.repeat) / args.repeat
+        parser_time = timeit.timeit(lambda: parse_llm_json(text), number=args.repeat) / args.repeat
+        regex_keys = len(regex_extract(text) or {})
+        data, failed = parse_llm_json(text)
+        print(f"{name:<38} {len(text):>7} {regex_time * 1e6:>10.1f} {regex_keys:>5} "
+              f"{parser_time * 1e6:>10.1f} {len(data or {}):>5} {len(failed):>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark concurrent registrations and logins through crud and the password pool.
+
+Registers --users users and logs each of them in --logins times, with
+--concurrency operations in flight, once per --workers value (0 hashes on the
+default thread pool, like the old asyncio.to_thread code). While that runs a
+probe keeps submitting a trivial job to the default thread pool, standing in
+for the other routes that need it, and reports how long each one waited.
+With --old-rounds users are registered at that cost first, so every first
+login also rehashes.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_passwords --users 50 --logins 2 --workers 0 4
+    python -m benchmarks.bench_passwords --rounds 12 --old-rounds 10
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--logins", type=int, default=2, help="logins per user")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost factor")
+    parser.add_argument("--old-rounds", type=int, help="register at this cost so logins rehash")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    return parser.parse_args()
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+async def probe_thread_pool(stop, waits):
+    """Time how long trivial jobs wait for a default thread pool slot."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.to_thread(time.perf_counter)
+        waits.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+async def run_all(operations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(operation):
+        async with semaphore:
+            return await operation()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited(operation) for operation in operations))
+    return results, time.perf_counter() - started
+
+async def bench(args, workers, run):
+    from app import crud, database, passwords, schemas
+
+    passwords.start_pool(workers)
+    # Start the worker processes before timing
+    await passwords.hash_password("warm up")
+
+    emails = [f"bench-{run}-{i}@example.com" for i in range(args.users)]
+    stop = asyncio.Event()
+    waits = []
+    probe = asyncio.create_task(probe_thread_pool(stop, waits))
+
+    async def register(email):
+        async with database.AsyncSessionLocal() as db:
+            return await crud.create_user(db, schemas.UserCreate(email=email, password=email))
+
+    async def login(email):
+        async with database.AsyncSessionLocal() as db:
+            return await crud.authenticate_user(db, email, email)
+
+    passwords.BCRYPT_ROUNDS = args.old_rounds or args.rounds
+    _, register_seconds = await run_all([lambda e=e: register(e) for e in emails], args.concurrency)
+    passwords.BCRYPT_ROUNDS = args.rounds
+    logins = [lambda e=e: login(e) for _ in range(args.logins) for e in emails]
+    users, login_seconds = await run_all(logins, args.concurrency)
+
+    stop.set()
+    await probe
+    passwords.shutdown_pool()
+    failed = sum(user is None for user in users)
+    print(
+        f"workers={workers:<3} register {args.users / register_seconds:7.1f}/s  "
+        f"login {len(logins) / login_seconds:7.1f}/s  failed logins {failed}  "
+        f"thread pool wait p50 {percentile(waits, 50) * 1000:.1f}ms "
+        f"p99 {percentile(waits, 99) * 1000:.1f}ms max {max(waits, default=0) * 1000:.1f}ms"
+    )
+
+async def main():
+    args = parse_args()
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'passwords.db')}")
+    from app import database, models
+
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    print(
+        f"{args.users} registrations and {args.users * args.logins} logins, concurrency {args.concurrency}, "
+        f"cost {args.rounds}" + (f" (registered at {args.old_rounds})" if args.old_rounds else "")
+    )
+    for run, workers in enumerate(args.workers):
+        await bench(args, workers, run)
+    await database.async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""Fuzz parse_llm_json with mutated Gemini responses.
+
+Checks that the recorded fixtures parse as expected, then applies random
+mutations (truncation, comments, trailing commas, stray braces, deleted
+characters) and checks that the parser never raises, that everything it
+recovers from a truncated response matches the clean parse, and that
+mutations the parser tolerates (comments, trailing commas, prose) lose
+nothing. Exits non-zero on any violation.
+
+Run from the backend directory:
+
+    python -m benchmarks.fuzz_llm_parser --iterations 5000 --seed 1
+"""
+import argparse
+import random
+import re
+import sys
+
+from app.llm_parser import parse_llm_json
+from benchmarks.llm_fixtures import load_fixtures
+
+def add_comments(text, rng):
+    # After a comma or opening bracket that ends a line, outside any string
+    lines = text.split("\n")
+    for i in rng.sample(range(len(lines)), k=min(3, len(lines))):
+        if lines[i].rstrip().endswith((",", "[", "{")):
+            lines[i] += rng.choice(["  // note", "  /* {tricky] */"])
+    return "\n".join(lines)
+
+def add_trailing_commas(text, rng):
+    return re.sub(r'(["\d\]}el])(\s*\n\s*[\]}])', lambda m: m.group(1) + "," + m.group(2) if rng.random() < 0.5 else m.group(0), text)
+
+def add_prose(text, rng):
+    return rng.choice(["Sure, here it is:\n", "", "Itinerary below.\n\n"]) + text + rng.choice(["", "\nHope this helps!", "\n}"])
+
+# Mutations that must not lose any entries
+LOSSLESS = {"comments": add_comments, "trailing_commas": add_trailing_commas, "prose": add_prose}
+
+def truncate(text, rng):
+    return text[:rng.randrange(len(text))]
+
+def delete_char(text, rng):
+    i = rng.randrange(len(text))
+    return text[:i] + text[i + 1:]
+
+def stray_brace(text, rng):
+    i = rng.randrange(len(text))
+    return text[:i] + rng.choice("{}[],:\"") + text[i:]
+
+# Mutations that may lose entries; the parser must still never raise
+LOSSY = {"truncate": truncate, "delete_char": delete_char, "stray_brace": stray_brace}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = []
+    fixtures = load_fixtures()
+    clean = {}
+    for name, text, expected in fixtures:
+        data, failed = parse_llm_json(text)
+        if len(data or {}) != expected["keys"] or failed != expected["failed"]:
+            failures.append(f"{name}: got {len(data or {})} keys, failed={failed}; expected {expected}")
+        clean[name] = data or {}
+
+    for i in range(args.iterations):
+        name, text, _ = rng.choice(fixtures)
+        kind = rng.choice(sorted(LOSSLESS) + sorted(LOSSY))
+        mutated = (LOSSLESS.get(kind) or LOSSY[kind])(text, rng)
+        try:
+            data, failed = parse_llm_json(mutated)
+        except Exception as e:
+            failures.append(f"{name}/{kind}#{i}: raised {type(e).__name__}: {e}")
+            continue
+        data = data or {}
+        if kind in LOSSLESS and data != clean[name]:
+            failures.append(f"{name}/{kind}#{i}: lost entries {sorted(set(clean[name]) - set(data))}")
+        elif kind == "truncate":
+            # A cut-off response can lose entries but every entry it yields must be complete
+            for key, value in data.items():
+                if value != clean[name].get(key):
+                    failures.append(f"{name}/{kind}#{i}: entry {key} differs from the clean parse")
+
+    print(f"{len(fixtures)} fixtures, {args.iterations} mutations, {len(failures)} failures")
+    for failure in failures[:20]:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Gemini responses for the parser fuzz and benchmark scripts.
+
+Files in fixtures/gemini/ are model outputs in the shapes Gemini actually
+returns: fenced, with prose around them, with echoed // placeholders,
+trailing commas, a malformed day or cut off mid-day. expected.json records
+how many top-level keys each should yield and which keys should fail.
+Drop newly captured responses into the directory and add them there.
+"""
+import json
+import os
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "gemini")
+
+def load_fixtures():
+    """Return [(name, text, expected)] for every recorded response."""
+    with open(os.path.join(FIXTURES_DIR, "expected.json")) as f:
+        expected = json.load(f)
+    fixtures = []
+    for name in sorted(expected):
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            fixtures.append((name, f.read(), expected[name]))
+    return fixtures
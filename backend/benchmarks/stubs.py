@@ -0,0 +1,181 @@
+"""Canned Places, Details, ORS and Gemini upstreams for offline benchmarks.
+
+StubUpstreams is an httpx transport answering the Google Places text
+search and details endpoints and the ORS directions and matrix endpoints
+with deterministic, destination-dependent data. StubGenerativeModel stands
+in for google.generativeai.GenerativeModel. Both support per-upstream
+latency and random error injection and count the calls they receive.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+
+from app.geo import ROAD_FACTOR, haversine_km
+from app.prompts import DESCRIPTION_ID_PREFIX, ID_PREFIXES
+
+DEFAULT_LATENCY = {"places": 0.2, "details": 0.15, "ors": 0.3, "gemini": 3.0}
+
+def _seed(*parts):
+    return int(hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:12], 16)
+
+def _center(destination):
+    rng = random.Random(_seed(destination.strip().casefold()))
+    return rng.uniform(-50, 60), rng.uniform(-120, 140)
+
+class StubUpstreams(httpx.AsyncBaseTransport):
+    def __init__(self, latency=None, error_rate=0.0, seed=0, results_per_search=5):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.error_rate = error_rate
+        self.results_per_search = results_per_search
+        self.calls = Counter()
+        self._rng = random.Random(seed)
+        self._places = {}
+
+    async def handle_async_request(self, request):
+        path = request.url.path
+        if path.endswith("/place/textsearch/json"):
+            upstream, handler = "places", self._text_search
+        elif path.endswith("/place/details/json"):
+            upstream, handler = "details", self._details
+        elif "/v2/matrix/" in path:
+            upstream, handler = "ors", self._matrix
+        elif "/v2/directions/" in path:
+            upstream, handler = "ors", self._directions
+        else:
+            return httpx.Response(404, json={"error": f"no stub for {path}"})
+
+        self.calls[upstream] += 1
+        await asyncio.sleep(self.latency[upstream])
+        if self._rng.random() < self.error_rate:
+            return httpx.Response(503, json={"error": "injected failure"})
+        return httpx.Response(200, json=handler(request))
+
+    def _text_search(self, request):
+        query = request.url.params["query"]
+        destination = query.split(" in ", 1)[-1]
+        lat, lng = _center(destination)
+        rng = random.Random(_seed(query))
+        results = []
+        for i in range(self.results_per_search):
+            place_id = f"stub-{_seed(query, i):x}"
+            location = {"lat": lat + rng.uniform(-0.05, 0.05), "lng": lng + rng.uniform(-0.05, 0.05)}
+            name = f"{query.split(' in ')[0].title()} {i + 1}"
+            self._places[place_id] = {"name": name, "location": location}
+            results.append({
+                "name": name,
+                "place_id": place_id,
+                "rating": round(rng.uniform(3.5, 5.0), 1),
+                "formatted_address": f"{i + 1} Stub Street, {destination}",
+                "geometry": {"location": location},
+            })
+        return {"status": "OK", "results": results}
+
+    def _details(self, request):
+        place_id = request.url.params["place_id"]
+        place = self._places.get(place_id, {"name": place_id})
+        rng = random.Random(_seed(place_id))
+        return {"status": "OK", "result": {
+            "name": place["name"],
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "formatted_phone_number": "+1 555 0100",
+            "website": f"https://example.com/{place_id}",
+            "url": f"https://maps.google.com/?cid={place_id}",
+            "reviews": [{"text": "A lovely stop on any trip. " * 20}],
+        }}
+
+    @staticmethod
+    def _road_meters(a, b):
+        # ORS coordinates are [lng, lat]
+        return haversine_km((a[1], a[0]), (b[1], b[0])) * ROAD_FACTOR * 1000
+
+    def _directions(self, request):
+        origin, destination = json.loads(request.content)["coordinates"]
+        return {"routes": [{"summary": {"distance": self._road_meters(origin, destination)}}]}
+
+    def _matrix(self, request):
+        body = json.loads(request.content)
+        locations = body["locations"]
+        return {"distances": [
+            [self._road_meters(locations[s], locations[d]) for d in body["destinations"]]
+            for s in body["sources"]
+        ]}
+
+class _UsageMetadata:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+
+class _Response:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt, text)
+
+class _StreamedResponse:
+    def __init__(self, prompt, text, latency, chunk_size=200):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self._delay = latency / max(len(self._chunks), 1)
+        self.usage_metadata = _UsageMetadata(prompt, text)
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield _Response("", chunk)
+
+class StubGemini:
+    """Factory for stub models sharing latency, error injection and call counts."""
+
+    def __init__(self, latency=None, error_rate=0.0, seed=0):
+        self.latency = latency if latency is not None else DEFAULT_LATENCY["gemini"]
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def __call__(self, model_name, **kwargs):
+        return StubGenerativeModel(self)
+
+class StubGenerativeModel:
+    def __init__(self, stub):
+        self._stub = stub
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        stub = self._stub
+        stub.calls += 1
+        if stub._rng.random() < stub.error_rate:
+            await asyncio.sleep(stub.latency / 10)
+            raise google_exceptions.ServiceUnavailable("injected failure")
+        text = "```json\n" + json.dumps(_answer(prompt), indent=2) + "\n```"
+        if stream:
+            return _StreamedResponse(prompt, text, stub.latency)
+        await asyncio.sleep(stub.latency)
+        return _Response(prompt, text)
+
+def _answer(prompt):
+    prefixes = "".join(ID_PREFIXES.values()) + DESCRIPTION_ID_PREFIX
+    place_ids = re.findall(rf"^\s*([{prefixes}]\d+): ", prompt, re.MULTILINE)
+    if "description" in prompt and "place ID" in prompt:
+        return {place_id: f"Stub description of {place_id}." for place_id in place_ids}
+
+    keys = re.search(r"exactly these keys: (.*), each", prompt)
+    if keys:
+        days = re.findall(r'"(Day \d+)"', keys.group(1))
+    else:
+        count = int(re.search(r"for (\d+) days", prompt).group(1))
+        days = [f"Day {day}" for day in range(1, count + 1)]
+    return {day: _stub_day(place_ids, offset) for offset, day in enumerate(days)}
+
+def _stub_day(place_ids, offset):
+    def pick(prefix, n):
+        ids = [place_id for place_id in place_ids if place_id.startswith(prefix)] or [f"{prefix}1"]
+        return ids[(offset * 2 + n) % len(ids)]
+
+    slots = [("8:00 AM", "Breakfast", pick("R", 0)), ("10:00 AM", "Sightseeing", pick("A", 0)),
+             ("1:00 PM", "Lunch", pick("R", 1)), ("3:00 PM", "Sightseeing", pick("A", 1)),
+             ("7:00 PM", "Dinner", pick("R", 2)), ("9:00 PM", "Accommodation", pick("H", 0))]
+    return [{"time": time, "activity": activity, "id": place_id, "description": "Stub description."}
+            for time, activity, place_id in slots]
@@ -0,0 +1,13 @@
+import os
+import statistics
+
+from benchmarks.bench_import import measure
+
+# Median seconds allowed for a fresh `import app.itinerary_generator`; raise it on slow CI runners
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.0"))
+
+def test_itinerary_generator_import_is_lazy_and_within_budget():
+    samples = [measure("app.itinerary_generator") for _ in range(3)]
+    assert not any(sample["eager"] for sample in samples)
+    median = statistics.median(sample["seconds"] for sample in samples)
+    assert median <= IMPORT_BUDGET_SECONDS, f"import took {median * 1000:.0f} ms"
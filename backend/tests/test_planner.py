@@ -0,0 +1,90 @@
+import itertools
+import re
+
+from app import planner
+
+def place(place_id, lat, lng, **extra):
+    return {"place_id": place_id, "name": place_id, "location": {"lat": lat, "lng": lng}, **extra}
+
+# Two tight groups of points about 10 km apart
+WEST = [(48.85, 2.29), (48.851, 2.291), (48.852, 2.292), (48.853, 2.29)]
+EAST = [(48.85, 2.43), (48.851, 2.431), (48.852, 2.432)]
+
+def test_kmeans_separates_distant_groups():
+    labels = planner.kmeans(WEST + EAST, 2)
+    assert len(set(labels[:len(WEST)])) == 1
+    assert len(set(labels[len(WEST):])) == 1
+    assert labels[0] != labels[-1]
+
+def test_kmeans_is_deterministic_and_caps_k():
+    points = WEST + EAST
+    assert planner.kmeans(points, 3) == planner.kmeans(points, 3)
+    assert sorted(set(planner.kmeans(points[:2], 5))) == [0, 1]
+    assert planner.kmeans([], 3) == []
+
+def test_assign_places_to_days_groups_by_cluster():
+    places = [place(f"w{i}", *p) for i, p in enumerate(WEST)] + [place(f"e{i}", *p) for i, p in enumerate(EAST)]
+    places.append({"place_id": "nowhere", "name": "nowhere"})
+    days = planner.assign_places_to_days(places, 2)
+    ids = [{p["place_id"] for p in day} for day in days]
+    # Largest cluster first; the place without a location goes round-robin
+    assert ids[0] == {"w0", "w1", "w2", "w3", "nowhere"}
+    assert ids[1] == {"e0", "e1", "e2"}
+
+def test_assign_places_to_days_reuses_clusters_when_short():
+    days = planner.assign_places_to_days([place("a", 48.85, 2.29)], 3)
+    assert [[p["place_id"] for p in day] for day in days] == [["a"], ["a"], ["a"]]
+
+def test_order_stops_finds_the_shortest_path_and_keeps_start():
+    # Points on a line, given out of order: the best open path walks it end to end
+    points = [(48.85, 2.30), (48.85, 2.34), (48.85, 2.31), (48.85, 2.33), (48.85, 2.32)]
+    matrix = planner.distance_matrix(points)
+    path = planner.order_stops(matrix)
+    assert path == [0, 2, 4, 3, 1]
+
+def test_order_stops_2opt_matches_brute_force():
+    points = [(48.85, 2.29), (48.87, 2.35), (48.86, 2.30), (48.88, 2.31), (48.84, 2.34), (48.86, 2.36), (48.85, 2.32)]
+    matrix = planner.distance_matrix(points)
+    path = planner.order_stops(matrix)
+    assert path[0] == 0 and sorted(path) == list(range(len(points)))
+    best = min(planner._path_length([0, *rest], matrix) for rest in itertools.permutations(range(1, len(points))))
+    assert planner._path_length(path, matrix) <= best * 1.05
+
+def test_format_time():
+    assert planner.format_time(8 * 60) == "8:00 AM"
+    assert planner.format_time(12 * 60 + 5) == "12:05 PM"
+    assert planner.format_time(24 * 60 + 30) == "12:30 AM"
+
+def test_schedule_respects_meal_and_check_in_times():
+    stops = [
+        {"activity": "Breakfast", "location": {"lat": 48.85, "lng": 2.29}},
+        {"activity": "Sightseeing", "location": {"lat": 48.86, "lng": 2.30}},
+        {"activity": "Dinner", "location": {}},
+        {"activity": "Accommodation", "location": {"lat": 48.85, "lng": 2.29}},
+    ]
+    planner._schedule(stops)
+    assert stops[0]["time"] == "8:00 AM"
+    assert re.fullmatch(r"\d+ mins", stops[0]["estimated_travel_time"])
+    minutes = int(stops[0]["estimated_travel_time"].split()[0])
+    assert stops[1]["time"] == planner.format_time(8 * 60 + planner.MEAL_MINUTES + minutes)
+    assert stops[2]["time"] == "7:00 PM"
+    assert stops[2]["estimated_travel_time"] == "N/A"
+    assert stops[3]["time"] == "9:00 PM"
+    assert stops[3]["estimated_travel_time"] == "N/A"
+
+def test_plan_itinerary_builds_each_day():
+    attractions = [place(f"w{i}", *p) for i, p in enumerate(WEST)] + [place(f"e{i}", *p) for i, p in enumerate(EAST)]
+    restaurants = [place(f"r{i}", 48.85 + i * 0.001, 2.29 + i * 0.03) for i in range(6)]
+    hotel = place("hotel", 48.851, 2.36)
+    plan = planner.plan_itinerary(2, attractions, restaurants, [hotel])
+
+    assert list(plan) == ["Day 1", "Day 2"]
+    for stops in plan.values():
+        activities = [stop["activity"] for stop in stops]
+        assert activities[0] == "Breakfast" and activities[-2:] == ["Dinner", "Accommodation"]
+        assert activities.count("Lunch") == 1
+        meals = [stop["place_id"] for stop in stops if stop["activity"] in ("Breakfast", "Lunch", "Dinner")]
+        assert len(set(meals)) == len(meals)
+        assert all(stop["time"] and stop["estimated_travel_time"] for stop in stops)
+    seen = [stop["place_id"] for stops in plan.values() for stop in stops if stop["activity"] == "Sightseeing"]
+    assert sorted(seen) == sorted(p["place_id"] for p in attractions)